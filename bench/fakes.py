@@ -0,0 +1,275 @@
+# bench/fakes.py
+"""
+Offline stand-ins for Vertex/Gemini, Imagen, RAG and the DearMind backend.
+Each fake sleeps for a latency drawn from a Latency profile and fails with
+the configured probability, so the FastAPI app can be load-tested without
+spending quota. `install()` wires all of them into the running services.
+"""
+
+import io
+import json
+import math
+import time
+import random
+import asyncio
+import datetime
+from types import SimpleNamespace
+from typing import Optional
+
+from PIL import Image
+
+
+# ─── LATENCY / ERROR PROFILES ──────────────────────────────────────────────────
+class Latency:
+    """
+    Log-normal latency with the given median (seconds) and spread (sigma),
+    plus an independent error probability.
+    """
+
+    def __init__(self, median: float, sigma: float = 0.3, error_rate: float = 0.0):
+        self.median = median
+        self.sigma = sigma
+        self.error_rate = error_rate
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        """
+        Parses "median[:sigma[:error_rate]]", e.g. "0.8:0.4:0.01".
+        """
+        fields = [float(x) for x in spec.split(":")]
+        return cls(*fields)
+
+    def sample(self) -> float:
+        if self.median <= 0:
+            return 0.0
+        return random.lognormvariate(math.log(self.median), self.sigma)
+
+    def should_fail(self) -> bool:
+        return random.random() < self.error_rate
+
+    def as_dict(self) -> dict:
+        return {"median": self.median, "sigma": self.sigma, "error_rate": self.error_rate}
+
+
+def _quota_error() -> Exception:
+    # Same exception type Vertex raises on 429, so retry logic sees a realistic error
+    try:
+        from google.api_core.exceptions import ResourceExhausted
+        return ResourceExhausted("fake quota exceeded")
+    except ImportError:
+        return RuntimeError("429 fake quota exceeded")
+
+
+async def _async_wait(profile: Latency) -> None:
+    await asyncio.sleep(profile.sample())
+    if profile.should_fail():
+        raise _quota_error()
+
+
+def _sync_wait(profile: Latency) -> None:
+    time.sleep(profile.sample())
+    if profile.should_fail():
+        raise _quota_error()
+
+
+# ─── MODEL FAKES ───────────────────────────────────────────────────────────────
+class FakeGenerativeModel:
+    """Stands in for vertexai GenerativeModel (analysis and reward letter)."""
+
+    def __init__(self, profile: Latency, reply: str):
+        self.profile = profile
+        self.reply = reply
+
+    async def generate_content_async(self, contents, **kwargs):
+        await _async_wait(self.profile)
+        return SimpleNamespace(text=self.reply)
+
+    def generate_content(self, contents, **kwargs):
+        _sync_wait(self.profile)
+        return SimpleNamespace(text=self.reply)
+
+
+class FakeGeneratedImage:
+    def __init__(self, png: bytes):
+        self._image_bytes = png
+        self._mime_type = "image/png"
+        self.image = Image.open(io.BytesIO(png))
+
+    def save(self, location: str, include_generation_parameters: bool = False) -> None:
+        with open(location, "wb") as f:
+            f.write(self._image_bytes)
+
+
+class FakeImageGenerationModel:
+    """Stands in for vertexai ImageGenerationModel; blocking like the real SDK."""
+
+    def __init__(self, profile: Latency, size: int = 1024):
+        self.profile = profile
+        self._png = make_png(size, seed=0)
+
+    def generate_images(self, prompt: str, number_of_images: int = 1, **kwargs):
+        _sync_wait(self.profile)
+        return [FakeGeneratedImage(self._png) for _ in range(number_of_images)]
+
+
+class _FakeChat:
+    def __init__(self, profile: Latency, history):
+        self.profile = profile
+        self._history = list(history or [])
+
+    def get_history(self, curated: bool = False):
+        return list(self._history)
+
+    async def send_message(self, message, config=None):
+        await _async_wait(self.profile)
+        return SimpleNamespace(text=f"I hear you. ({len(self._history)} earlier turns)")
+
+    async def send_message_stream(self, message, config=None):
+        profile = self.profile
+
+        async def chunks():
+            total = profile.sample()
+            if profile.should_fail():
+                await asyncio.sleep(total)
+                raise _quota_error()
+            words = "I hear you and I am here for you today".split()
+            for w in words:
+                await asyncio.sleep(total / len(words))
+                yield SimpleNamespace(text=w + " ")
+
+        return chunks()
+
+
+class FakeGenaiClient:
+    """Stands in for google.genai.Client (only the aio.chats surface is used)."""
+
+    def __init__(self, profile: Latency):
+        profile_ = profile
+
+        class _Chats:
+            def create(self, model, config=None, history=None):
+                return _FakeChat(profile_, history)
+
+        class _Models:
+            async def generate_content(self, model, contents, config=None):
+                await _async_wait(profile_)
+                return SimpleNamespace(text="The user talked about their week and felt calmer over time.")
+
+        self.aio = SimpleNamespace(chats=_Chats(), models=_Models())
+        self.chats = _Chats()
+
+
+def make_fake_rag(profile: Latency, chunk: str = "Art therapy theory excerpt. ", top_k: int = 5):
+    """
+    Returns a blocking replacement for analyze_service._rag_query.
+    """
+    def rag_query(text: str, k: int, threshold: float) -> str:
+        _sync_wait(profile)
+        return " ".join([chunk] * min(k, top_k))
+    return rag_query
+
+
+# ─── BACKEND FAKE ──────────────────────────────────────────────────────────────
+class _FakeResponse:
+    def __init__(self, status_code: int, payload):
+        self.status_code = status_code
+        self._payload = payload
+        self.content = json.dumps(payload).encode("utf-8")
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            import requests
+            raise requests.exceptions.HTTPError(f"{self.status_code} fake backend error", response=self)
+
+    def json(self):
+        return self._payload
+
+
+class FakeBackendSession:
+    """
+    Stands in for the pooled requests.Session used for the onrender backend
+    (history / diary) and reward callbacks. History grows by two turns per
+    /chat call for each token, like the real backend.
+    """
+
+    def __init__(self, profile: Latency, history_turns: int = 10, diary_entries: int = 2):
+        self.profile = profile
+        self.history_turns = history_turns
+        self.diary_entries = diary_entries
+        self._histories = {}
+
+    def _history(self, token: str) -> list:
+        if token not in self._histories:
+            self._histories[token] = [
+                {"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} of {token}"}
+                for i in range(self.history_turns)
+            ]
+        return self._histories[token]
+
+    def record_turn(self, token: str, message: str, reply: str) -> None:
+        self._history(token).extend([
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": reply},
+        ])
+
+    def get(self, url: str, headers: Optional[dict] = None, timeout: Optional[float] = None, **kwargs):
+        _sync_wait(self.profile)
+        token = (headers or {}).get("Authorization", "").replace("Bearer ", "")
+        if "/chat/history" in url:
+            return _FakeResponse(200, list(self._history(token)))
+        if "/diary/by-date" in url:
+            today = datetime.date.today().isoformat()
+            return _FakeResponse(200, [{"text": f"diary {i} on {today}"} for i in range(self.diary_entries)])
+        return _FakeResponse(200, {})
+
+    def post(self, url: str, json=None, timeout: Optional[float] = None, **kwargs):
+        _sync_wait(self.profile)
+        return _FakeResponse(200, {})
+
+
+# ─── PAYLOADS ──────────────────────────────────────────────────────────────────
+def make_png(size: int, seed: int) -> bytes:
+    """
+    A deterministic noisy PNG of size x size pixels (noise keeps it from compressing to nothing).
+    """
+    rnd = random.Random(seed)
+    small = Image.frombytes("RGB", (64, 64), bytes(rnd.getrandbits(8) for _ in range(64 * 64 * 3)))
+    img = small.resize((size, size), Image.BILINEAR)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+# ─── WIRING ────────────────────────────────────────────────────────────────────
+def install(
+    gemini: Latency,
+    imagen: Latency,
+    chat: Latency,
+    rag: Latency,
+    backend: Latency,
+    history_turns: int = 10,
+) -> FakeBackendSession:
+    """
+    Replaces every external dependency of the services with a fake.
+    Must run after the services are imported. Returns the backend fake.
+    """
+    import utils.utils as backend_utils
+    import services.analyze_service as analyze_service
+    import services.reward_service as reward_service
+    import services.chatbot_service as chatbot_service
+    from utils.models import register_model
+
+    analysis = '{"emotion": "positive", "severity": "safe"}'
+    register_model(analyze_service.MODEL_NAME, lambda: FakeGenerativeModel(gemini, analysis))
+    if analyze_service.CASCADE_MODEL_NAME:
+        register_model(analyze_service.CASCADE_MODEL_NAME, lambda: FakeGenerativeModel(gemini, analysis))
+    register_model(reward_service.TEXT_MODEL_NAME, lambda: FakeGenerativeModel(gemini, "You did great today!"))
+    register_model(reward_service.IMAGE_MODEL_002, lambda: FakeImageGenerationModel(imagen))
+    register_model(reward_service.IMAGE_MODEL_006, lambda: FakeImageGenerationModel(imagen))
+    register_model(chatbot_service.GENAI_CLIENT, lambda: FakeGenaiClient(chat))
+    analyze_service._rag_query = make_fake_rag(rag)
+
+    session = FakeBackendSession(backend, history_turns=history_turns)
+    backend_utils.session = session
+    reward_service.http_session = session
+    return session
@@ -0,0 +1,252 @@
+# bench/run.py
+"""
+Offline load test for the /ai endpoints.
+
+Drives the FastAPI app in-process (httpx ASGI transport) with every external
+dependency replaced by the fakes in bench/fakes.py, and writes a JSON report
+with throughput, latency percentiles, error counts and peak memory.
+
+    python -m bench.run --route analyze --concurrency 16 --requests 200 --out analyze.json
+    python -m bench.run --route analyze --concurrency 16 --requests 200 --baseline analyze.json --max-regression 0.10
+
+With --baseline, the run fails (exit code 1) if p95 latency or throughput is
+more than --max-regression worse than the baseline report. A baseline for
+another route or concurrency is refused (exit code 2).
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import asyncio
+import logging
+import argparse
+import platform
+import resource
+import statistics
+import tracemalloc
+from typing import List, Optional
+
+import httpx
+
+from bench.fakes import Latency, install, make_png
+
+ROUTES = ("analyze", "analyze-upload", "reward", "chat", "chat-stream")
+
+
+# ─── REQUEST BUILDERS ──────────────────────────────────────────────────────────
+class Workload:
+    """
+    Pre-builds request payloads so payload generation isn't part of the measurement.
+    """
+
+    def __init__(self, args, backend):
+        self.route = args.route
+        self.backend = backend
+        self.users = args.users
+        self.images = [make_png(args.image_size, seed=i) for i in range(args.distinct)]
+        self.images_b64 = [base64.b64encode(img).decode("ascii") for img in self.images]
+        self.subjects = ["house", "tree", "person", "family", "sea"]
+
+    async def send(self, client: httpx.AsyncClient, i: int) -> int:
+        n = i % len(self.images)
+        if self.route == "analyze":
+            body = {"image": self.images_b64[n], "subject": self.subjects[i % len(self.subjects)], "text": "today"}
+            r = await client.post("/ai/analyze", json=body)
+        elif self.route == "analyze-upload":
+            r = await client.post(
+                "/ai/analyze/upload",
+                files={"image": ("drawing.png", self.images[n], "image/png")},
+                data={"subject": self.subjects[i % len(self.subjects)], "text": "today"},
+            )
+        elif self.route == "reward":
+            body = {"images": [self.images_b64[n]], "style": "watercolor", "diaries": ["a calm day"]}
+            r = await client.post("/ai/reward", json=body)
+        else:
+            token = f"bench-user-{i % self.users}"
+            message = f"message {i}"
+            headers = {"Authorization": f"Bearer {token}"}
+            if self.route == "chat":
+                r = await client.post("/ai/chat", json={"message": message}, headers=headers)
+                reply = r.json().get("reply", "") if r.status_code == 200 else ""
+            else:
+                async with client.stream("POST", "/ai/chat/stream", json={"message": message}, headers=headers) as r:
+                    body = (await r.aread()).decode("utf-8")
+                if "event: error" in body:
+                    return 599  # in-band stream error
+                reply = ""
+            if r.status_code == 200:
+                # The real backend stores each exchange, so the next history fetch sees it
+                self.backend.record_turn(token, message, reply)
+        return r.status_code
+
+
+# ─── RUNNER ────────────────────────────────────────────────────────────────────
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def run(args) -> dict:
+    # Importing main pulls in the routers and services; fakes go in afterwards
+    from main import app
+    backend = install(
+        gemini=Latency.parse(args.gemini),
+        imagen=Latency.parse(args.imagen),
+        chat=Latency.parse(args.chat),
+        rag=Latency.parse(args.rag),
+        backend=Latency.parse(args.backend),
+        history_turns=args.history_turns,
+    )
+    workload = Workload(args, backend)
+    latencies: List[float] = []
+    statuses: dict = {}
+    errors: dict = {}
+    counter = iter(range(args.requests))
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                status = await workload.send(client, i)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status != 200 and status != 202:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for i in range(args.warmup):
+                await workload.send(client, i)
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+            wall = time.perf_counter() - started
+
+    latencies.sort()
+    report = {
+        "route": args.route,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "distinct_payloads": args.distinct,
+        "wall_seconds": wall,
+        "throughput_rps": args.requests / wall if wall else 0.0,
+        "latency_seconds": {
+            "p50": _percentile(latencies, 0.50),
+            "p95": _percentile(latencies, 0.95),
+            "p99": _percentile(latencies, 0.99),
+            "mean": statistics.fmean(latencies) if latencies else 0.0,
+            "max": latencies[-1] if latencies else 0.0,
+        },
+        "statuses": statuses,
+        "errors": sum(errors.values()),
+        "error_rate": sum(errors.values()) / args.requests if args.requests else 0.0,
+        "peak_rss_mb": _peak_rss_mb(),
+        "profiles": {
+            "gemini": Latency.parse(args.gemini).as_dict(),
+            "imagen": Latency.parse(args.imagen).as_dict(),
+            "chat": Latency.parse(args.chat).as_dict(),
+            "rag": Latency.parse(args.rag).as_dict(),
+            "backend": Latency.parse(args.backend).as_dict(),
+        },
+        "python": platform.python_version(),
+    }
+    if args.tracemalloc:
+        report["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    return report
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> List[str]:
+    """
+    Returns a list of regressions of `report` against `baseline` (empty if none).
+    Raises ValueError if the two runs used a different route or concurrency.
+    """
+    for key in ("route", "concurrency"):
+        if report.get(key) != baseline.get(key):
+            raise ValueError(f"baseline {key} is {baseline.get(key)!r}, this run used {report.get(key)!r}")
+    problems = []
+    p95, base_p95 = report["latency_seconds"]["p95"], baseline["latency_seconds"]["p95"]
+    if base_p95 and p95 > base_p95 * (1 + max_regression):
+        problems.append(f"p95 latency {p95:.3f}s vs baseline {base_p95:.3f}s")
+    rps, base_rps = report["throughput_rps"], baseline["throughput_rps"]
+    if base_rps and rps < base_rps * (1 - max_regression):
+        problems.append(f"throughput {rps:.1f} rps vs baseline {base_rps:.1f} rps")
+    if report["error_rate"] > baseline["error_rate"] + max_regression:
+        problems.append(f"error rate {report['error_rate']:.3f} vs baseline {baseline['error_rate']:.3f}")
+    return problems
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(description="Offline DearMind AI load test")
+    p.add_argument("--route", choices=ROUTES, default="analyze")
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--requests", type=int, default=100)
+    p.add_argument("--warmup", type=int, default=2, help="unmeasured requests sent first")
+    p.add_argument("--distinct", type=int, default=None,
+                   help="distinct image payloads (default: one per request, i.e. no cache hits)")
+    p.add_argument("--image-size", type=int, default=1024, help="side length of generated images")
+    p.add_argument("--users", type=int, default=16, help="distinct chat users (bearer tokens)")
+    p.add_argument("--history-turns", type=int, default=10, help="initial chat history per user")
+    # Latency profiles: median[:sigma[:error_rate]]
+    p.add_argument("--gemini", default="0.8:0.3:0", help="Gemini generate_content latency")
+    p.add_argument("--imagen", default="4.0:0.3:0", help="Imagen generate_images latency")
+    p.add_argument("--chat", default="0.6:0.3:0", help="chat send_message latency")
+    p.add_argument("--rag", default="0.3:0.3:0", help="RAG retrieval latency")
+    p.add_argument("--backend", default="0.1:0.3:0", help="history/diary backend latency")
+    p.add_argument("--seed", type=int, default=None, help="random seed for latency sampling")
+    p.add_argument("--tracemalloc", action="store_true", help="also report peak Python heap")
+    p.add_argument("--out", default=None, help="write the JSON report here (default: stdout)")
+    p.add_argument("--baseline", default=None, help="baseline report to compare against")
+    p.add_argument("--max-regression", type=float, default=0.10)
+    args = p.parse_args(argv)
+    if args.distinct is None:
+        args.distinct = args.requests + args.warmup
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+    # Keep startup warm-up from touching the real SDKs
+    os.environ.setdefault("AI_WARMUP", "0")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        try:
+            problems = compare(report, baseline, args.max_regression)
+        except ValueError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            return 2
+        for problem in problems:
+            print(f"REGRESSION: {problem}", file=sys.stderr)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
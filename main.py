@@ -1,13 +1,112 @@
-from fastapi import FastAPI
-from routers import analyze, reward, chatbot
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from utils.startup import WARMUP_ENABLED, is_ready, run_warmup, startup_report, timed_import
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+# Routers are imported through timed_import so /startup can show per-module cost
+analyze = timed_import("routers.analyze")
+reward  = timed_import("routers.reward")
+chatbot = timed_import("routers.chatbot")
+
+from services.analyze_service import RAG_WARM_SUBJECTS, warm_retrieval_cache
+from services.reward_service import reward_jobs
+from utils.concurrency import shutdown_executor
+from utils.metrics import REQUEST_SECONDS, render_prometheus, start_request
+from utils.retry import set_deadline
+
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "60"))
+# Server-Timing header on every response (otherwise only with "X-Debug-Timing: 1")
+TIMING_HEADER = os.getenv("METRICS_TIMING_HEADER", "0") == "1"
+# Time budget of a request's model calls, retries included (0 = none)
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "60"))
+
+_background_tasks = set()
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("Startup imports: %s", startup_report()["imports"])
+    # Warm-ups run in the background so startup isn't delayed
+    if WARMUP_ENABLED:
+        _spawn(run_warmup())
+    if RAG_WARM_SUBJECTS:
+        _spawn(warm_retrieval_cache(RAG_WARM_SUBJECTS))
+    yield
+    # Let queued reward jobs finish before the worker pool goes away
+    await reward_jobs.shutdown(timeout=SHUTDOWN_TIMEOUT)
+    shutdown_executor(wait=True)
+
+app = FastAPI(lifespan=lifespan)
+
+def _route_label(request: Request) -> str:
+    """
+    Route template of the matched endpoint (e.g. /ai/reward/jobs/{job_id}),
+    so metric labels don't grow with path parameters.
+    """
+    route = request.scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "unmatched"
+    # Newer FastAPI versions report routes of included routers without their prefix
+    path_parts = request.url.path.strip("/").split("/")
+    template_parts = template.strip("/").split("/")
+    prefix = path_parts[:len(path_parts) - len(template_parts)]
+    return ("/" + "/".join(prefix) if prefix else "") + template
+
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    timings = start_request()
+    set_deadline(REQUEST_DEADLINE)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        route = _route_label(request)
+        timings.finish(route)
+        REQUEST_SECONDS.observe(elapsed, route=route, method=request.method, status=str(status))
+    if TIMING_HEADER or request.headers.get("x-debug-timing") == "1":
+        total = f"total;dur={elapsed * 1000:.1f}"
+        stages = timings.server_timing()
+        response.headers["Server-Timing"] = f"{stages}, {total}" if stages else total
+    return response
 
 @app.get("/")
 def root():
-    return {'Hello':'World!'} 
+    return {'Hello':'World!'}
+
+## Health
+@app.get("/healthz")
+def liveness():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readiness():
+    if not is_ready():
+        return JSONResponse(status_code=503, content={"status": "warming up"})
+    return {"status": "ready"}
+
+@app.get("/startup")
+def startup():
+    return startup_report()
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
 
 ## Router
 app.include_router(analyze.router, prefix="/ai")
 app.include_router(reward.router, prefix="/ai")
-app.include_router(chatbot.router, prefix="/ai")
\ No newline at end of file
+app.include_router(chatbot.router, prefix="/ai")
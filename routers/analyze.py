@@ -1,7 +1,18 @@
-from fastapi import APIRouter, HTTPException
+import json
+from typing import AsyncIterator, List, Optional
+from fastapi import APIRouter, File, Form, HTTPException, Query, Request, UploadFile
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional
-from services.analyze_service import analyze_diary
+from services.analyze_service import (
+    BATCH_CONCURRENCY,
+    BATCH_MAX_ITEMS,
+    analyze_batch,
+    analyze_diary,
+    analyze_image,
+    result_cache_stats,
+)
+from utils.uploads import read_raw_body, read_upload
+from utils.retry import error_status
 
 router = APIRouter()
 
@@ -14,12 +25,85 @@ class AnalyzeResult(BaseModel):
     emotion: str
     severity: str
 
+class AnalyzeBatchRequest(BaseModel):
+    items: List[AnalyzeRequest] = Field(..., description="Items to analyze, each like an /analyze body")
+    concurrency: Optional[int] = Field(
+        None, ge=1, description="Max items analyzed at once (capped by the server setting)"
+    )
+
 @router.post("/analyze", response_model=AnalyzeResult)
 async def interpret_diary(req: AnalyzeRequest):
     try:
         input_text = req.text or ""
-        result = analyze_diary(req.image, req.subject, input_text)
+        result = await analyze_diary(req.image, req.subject, input_text)
         return AnalyzeResult(emotion=result.emotion, severity=result.severity)
     
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+
+@router.post("/analyze/upload", response_model=AnalyzeResult)
+async def interpret_diary_upload(
+    image: UploadFile = File(..., description="Required image file"),
+    subject: str = Form(..., description="Required drawing subject"),
+    text: Optional[str] = Form(None, description="Optional text input"),
+):
+    """
+    multipart/form-data variant of /analyze: the image is sent as a file part.
+    """
+    image_bytes = await read_upload(image)
+    try:
+        result = await analyze_image(image_bytes, subject, text or "")
+        return AnalyzeResult(emotion=result.emotion, severity=result.severity)
+    except Exception as e:
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+
+@router.post("/analyze/raw", response_model=AnalyzeResult)
+async def interpret_diary_raw(
+    request: Request,
+    subject: str = Query(..., description="Required drawing subject"),
+    text: Optional[str] = Query(None, description="Optional text input"),
+):
+    """
+    Binary variant of /analyze: the request body is the image itself
+    (any image/* content type), subject and text go in the query string.
+    """
+    image_bytes = await read_raw_body(request)
+    try:
+        result = await analyze_image(image_bytes, subject, text or "")
+        return AnalyzeResult(emotion=result.emotion, severity=result.severity)
+    except Exception as e:
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+
+def _ndjson(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+async def _ndjson_stream(results) -> AsyncIterator[str]:
+    async for i, result in results:
+        if isinstance(result, Exception):
+            yield _ndjson({"index": i, "error": str(result), "status": error_status(result)})
+        else:
+            yield _ndjson({"index": i, "emotion": result.emotion, "severity": result.severity})
+
+@router.post("/analyze/batch")
+async def interpret_diary_batch(req: AnalyzeBatchRequest):
+    """
+    Analyzes many items in one request. Answers with NDJSON, one line per item
+    in completion order: {"index", "emotion", "severity"} on success,
+    {"index", "error", "status"} on failure (the other items still run).
+    """
+    if len(req.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} items per batch")
+    concurrency = min(req.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)
+    items = [(item.image, item.subject, item.text or "") for item in req.items]
+    return StreamingResponse(
+        _ndjson_stream(analyze_batch(items, concurrency)),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/analyze/cache/stats")
+def analyze_cache_stats():
+    """
+    Hit/miss counters of the analysis result cache.
+    """
+    return result_cache_stats()
@@ -1,7 +1,19 @@
+import json
+import logging
+from typing import AsyncIterator
 from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from services.chatbot_service import chat_with_history, get_initial_greeting
-from utils.auth import extract_bearer_token
+from services.chatbot_service import (
+    chat_with_history,
+    get_initial_greeting,
+    prefetch_context,
+    stream_chat_with_history,
+)
+from utils.auth import extract_bearer_token, optional_bearer_token
+from utils.retry import error_status
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -12,28 +24,65 @@ class ChatResponse(BaseModel):
     reply: str = Field(..., description="Assistant's response")
 
 @router.get("/chat/init", response_model=ChatResponse)
-async def init_chat():
+async def init_chat(request: Request):
     """
     Called when the chat UI first loads.
-    Returns the static greeting (and any initial context).
+    Returns the static greeting (and any initial context). With an
+    Authorization header, the user's chat context is also prefetched in the
+    background so the first /chat reply only waits for the model.
     """
     try:
         greeting = get_initial_greeting()
+        token = optional_bearer_token(request)
+        if token:
+            prefetch_context(token)
         return ChatResponse(reply=greeting)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=error_status(e), detail=str(e))
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(req: ChatRequest, request: Request):
     """
     Called whenever the user sends a new message.
     """
-    print(">> Authorization header:", request.headers.get("Authorization"))
     if request.headers.get("Authorization") is None:
-        print("Full request: ", request.headers)
+        logger.debug("/chat without Authorization header; header names: %s", list(request.headers.keys()))
+    token = extract_bearer_token(request)
     try:
-        token = extract_bearer_token(request)
-        answer = chat_with_history(req.message, token)
+        answer = await chat_with_history(req.message, token)
         return ChatResponse(reply=answer)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _sse_stream(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    reply = []
+    try:
+        async for text in chunks:
+            reply.append(text)
+            yield _sse("delta", {"text": text})
+    except Exception as e:
+        # Headers are already sent, so errors are reported in-band
+        yield _sse("error", {"detail": str(e)})
+        return
+    yield _sse("done", {"reply": "".join(reply)})
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(req: ChatRequest, request: Request):
+    """
+    Server-sent-events variant of /chat.
+    Emits `delta` events with reply text as it is generated, then a final
+    `done` event carrying the full reply (or an `error` event).
+    """
+    token = extract_bearer_token(request)
+    try:
+        chunks = await stream_chat_with_history(req.message, token)
+    except Exception as e:
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+    return StreamingResponse(
+        _sse_stream(chunks),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
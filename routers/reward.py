@@ -1,9 +1,14 @@
 # routers/reward_router.py
 
-from fastapi import APIRouter, HTTPException
+from urllib.parse import quote
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel, Field
-from typing import List, Optional
-from services.reward_service import generate_reward
+from typing import List, Literal, Optional
+from services.reward_service import check_callback_url, generate_reward, reward_jobs, to_base64
+from utils.job_queue import QueueFull
+from utils.uploads import read_upload
+from utils.retry import error_status
 
 router = APIRouter()
 
@@ -17,15 +22,107 @@ class RewardRequest(BaseModel):
     diaries: Optional[List[str]] = Field(
         None, description="Optional list of recent diary text entries"
     )
+    format: Optional[Literal["png", "jpeg", "webp"]] = Field(
+        None, description="Output image format; default is the PNG generated by the model, unchanged"
+    )
+    quality: int = Field(
+        85, ge=1, le=100, description="JPEG/WebP quality when format is jpeg or webp"
+    )
 
 class RewardResult(BaseModel):
-    image: str  = Field(..., description="Base64-encoded PNG of the generated painting")
+    image: str  = Field(..., description="Base64-encoded image of the generated painting")
+    mime_type: str = Field("image/png", description="MIME type of image")
     letter: str = Field(..., description="Generated letter")
 
+def _to_result(out) -> RewardResult:
+    return RewardResult(image=to_base64(out.image), mime_type=out.mime_type, letter=out.letter)
+
+class RewardJobRequest(RewardRequest):
+    callback_url: Optional[str] = Field(
+        None, description="Optional URL that receives the finished job as a JSON POST"
+    )
+
+class RewardJobStatus(BaseModel):
+    job_id: str
+    status: str = Field(..., description='One of "queued","running","done","failed"')
+    result: Optional[RewardResult] = None
+    error: Optional[str] = None
+
 @router.post("/reward", response_model=RewardResult)
 async def generate_reward_endpoint(req: RewardRequest):
     try:
-        out = generate_reward(req.images, req.style, req.diaries)
-        return RewardResult(image=out.image_b64, letter=out.letter)
+        out = await generate_reward(req.images, req.style, req.diaries, image_format=req.format, quality=req.quality)
+        return _to_result(out)
+    except Exception as e:
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+
+@router.post(
+    "/reward/image",
+    response_class=Response,
+    responses={200: {"content": {"image/png": {}, "image/jpeg": {}, "image/webp": {}}}},
+)
+async def generate_reward_image(req: RewardRequest):
+    """
+    Same as /reward, but the response body is the image itself (no base64)
+    and the letter comes URL-encoded (UTF-8) in the X-Reward-Letter header.
+    """
+    try:
+        out = await generate_reward(req.images, req.style, req.diaries, image_format=req.format, quality=req.quality)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+    return Response(content=out.image, media_type=out.mime_type, headers={"X-Reward-Letter": quote(out.letter)})
+
+@router.post("/reward/upload", response_model=RewardResult)
+async def generate_reward_upload(
+    images: List[UploadFile] = File(..., description="One or more image files"),
+    style: str = Form(..., description='Art style: one of "sketch","line_drawing","oil_painting","watercolor"'),
+    diaries: Optional[List[str]] = Form(None, description="Optional recent diary text entries (repeat the field)"),
+    format: Optional[Literal["png", "jpeg", "webp"]] = Form(None, description="Output image format"),
+    quality: int = Form(85, ge=1, le=100, description="JPEG/WebP quality"),
+):
+    """
+    multipart/form-data variant of /reward: images are sent as file parts.
+    """
+    image_bytes = [await read_upload(f) for f in images]
+    try:
+        out = await generate_reward(image_bytes, style, diaries, image_format=format, quality=quality)
+        return _to_result(out)
+    except Exception as e:
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+
+## Async job mode
+@router.post("/reward/jobs", status_code=202, response_model=RewardJobStatus)
+async def submit_reward_job(req: RewardJobRequest):
+    """
+    Queues a reward generation and returns 202 with a job id right away.
+    Poll GET /reward/jobs/{job_id}, or pass callback_url to be notified
+    (https, on a host listed in REWARD_CALLBACK_HOSTS).
+    """
+    if req.callback_url:
+        try:
+            check_callback_url(req.callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    try:
+        job = reward_jobs.submit(
+            req.images, req.style, req.diaries,
+            image_format=req.format, quality=req.quality, callback_url=req.callback_url,
+        )
+    except QueueFull as e:
+        return JSONResponse(status_code=503, content={"detail": str(e)}, headers={"Retry-After": "5"})
+    return RewardJobStatus(job_id=job.id, status=job.status)
+
+@router.get("/reward/jobs/stats")
+def reward_job_stats():
+    return reward_jobs.stats()
+
+@router.get("/reward/jobs/{job_id}", response_model=RewardJobStatus)
+def get_reward_job(job_id: str):
+    job = reward_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    result = None
+    if job.result is not None:
+        result = _to_result(job.result)
+    return RewardJobStatus(job_id=job.id, status=job.status, result=result, error=job.error)
+
@@ -0,0 +1,124 @@
+# server.py
+"""
+Production entry point: gunicorn managing uvicorn workers.
+
+    python server.py                     # one worker
+    SERVER_WORKERS=auto python server.py  # one worker per core
+
+Multiple workers are opt-in because per-process state (reward job status,
+caches, rate limiters, metrics) is not shared between workers yet.
+
+The app is imported once in the master (preload) together with the Vertex
+SDK modules and the fork-safe read-only assets in PRELOAD_MODELS (by default
+the local retrieval index, whose memory-mapped pages are then shared by all
+workers). Network clients are built in each worker after the fork.
+On SIGTERM workers stop accepting connections, finish in-flight requests and
+queued reward jobs, and are only killed after GRACEFUL_TIMEOUT.
+"""
+
+import os
+import logging
+from typing import List
+
+from gunicorn.app.base import BaseApplication
+
+logger = logging.getLogger(__name__)
+
+
+def cpu_count() -> int:
+    """
+    CPUs this container may use: the cgroup quota (Cloud Run, Docker --cpus)
+    or the affinity mask, whichever is smaller.
+    """
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            count = min(count, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return count
+
+
+# ─── CONFIG ────────────────────────────────────────────────────────────────────
+PORT = int(os.getenv("PORT", "8080"))
+# A number or "auto" (one worker per usable CPU); WEB_CONCURRENCY (a number,
+# gunicorn's own setting) is honoured too. The default stays at one until reward
+# job state is shared between workers (a poll may otherwise hit the wrong one).
+_workers = os.getenv("SERVER_WORKERS", os.getenv("WEB_CONCURRENCY", "1")).strip().lower()
+WORKERS = cpu_count() if _workers == "auto" else max(1, int(_workers))
+SHUTDOWN_TIMEOUT = int(float(os.getenv("SHUTDOWN_TIMEOUT", "60")))
+# Seconds a worker gets after SIGTERM before it is killed; covers the reward
+# job drain (SHUTDOWN_TIMEOUT) plus the last in-flight requests
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", str(SHUTDOWN_TIMEOUT + 10)))
+# Seconds without a heartbeat before the master restarts a worker
+WORKER_TIMEOUT = int(os.getenv("WORKER_TIMEOUT", "120"))
+KEEPALIVE = int(os.getenv("KEEPALIVE", "5"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info")
+
+
+def preload_models() -> List[str]:
+    """
+    Registry keys built in the master. Only objects that are safe to share
+    across fork() belong here (no gRPC channels, threads or open sockets).
+    """
+    env = os.getenv("PRELOAD_MODELS")
+    if env is not None:
+        return [m.strip() for m in env.split(",") if m.strip()]
+    from services.analyze_service import LOCAL_INDEX, RETRIEVAL_BACKEND
+    return [LOCAL_INDEX] if RETRIEVAL_BACKEND == "local" else []
+
+
+class DearMindServer(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Runs once in the master because preload_app is set
+        from main import app
+        from utils.models import preload_sdks, warm_up
+
+        try:
+            preload_sdks()
+        except ImportError as e:
+            logger.warning("SDK preload skipped: %s", e)
+        errors = warm_up(preload_models())
+        if errors:
+            logger.warning("Preload failed for %s", errors)
+        if WORKERS > 1:
+            logger.warning(
+                "Running %d workers: reward job status, caches, rate limits and metrics "
+                "are per worker; GET /ai/reward/jobs/{id} only finds jobs of the worker it hits", WORKERS
+            )
+        return app
+
+
+def options() -> dict:
+    opts = {
+        "bind": f"0.0.0.0:{PORT}",
+        "workers": WORKERS,
+        "worker_class": "uvicorn_worker.UvicornWorker",
+        "preload_app": True,
+        "graceful_timeout": GRACEFUL_TIMEOUT,
+        "timeout": WORKER_TIMEOUT,
+        "keepalive": KEEPALIVE,
+        "loglevel": LOG_LEVEL,
+        "accesslog": "-",
+    }
+    # Worker heartbeats go to tmpfs rather than the container's overlay filesystem
+    if os.path.isdir("/dev/shm"):
+        opts["worker_tmp_dir"] = "/dev/shm"
+    return opts
+
+
+if __name__ == "__main__":
+    DearMindServer(options()).run()
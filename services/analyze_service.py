@@ -3,47 +3,257 @@
 import os
 import base64
 import re
+import json
+import asyncio
+import hashlib
+import functools
+import logging
 from types import SimpleNamespace
-from typing import Optional
+from typing import AsyncIterator, Iterable, Optional, Sequence, Tuple, Union
 
-import vertexai
-import vertexai.preview.generative_models as generative_models
-from vertexai.preview.generative_models import GenerativeModel, Part
-from vertexai.preview import rag
+from utils.cache import TTLCache
+from utils.concurrency import call_model, run_blocking
+from utils.hedging import Hedger
+from utils.images import normalize_image_async
+from utils.metrics import counter, register_stats, span
+from utils.result_cache import ResultCache
+from utils.retry import set_deadline
+from utils.singleflight import SingleFlight
+from utils.models import (
+    embed_texts,
+    get_model,
+    get_model_async,
+    init_vertexai,
+    register_model,
+    vertex_embedding_model,
+    vertex_generative_model,
+    vertex_safety_settings,
+)
 
-# ─── CONFIG & INIT ─────────────────────────────────────────────────────────────
-PROJECT_ID = "sc2025-test"
-REGION     = "us-central1"
+logger = logging.getLogger(__name__)
 
-vertexai.init(project=PROJECT_ID, location=REGION)
-
-# ─── MODELS & RAG SETUP (once per process) ────────────────────────────────────
+# ─── MODELS & RAG SETUP (built lazily on first use) ───────────────────────────
 MODEL_NAME = "gemini-1.5-flash-002"
-model      = GenerativeModel(MODEL_NAME)
+register_model(MODEL_NAME, vertex_generative_model(MODEL_NAME))
 
 # RAG corpus you already created
 CORPUS_NAME = "projects/60897742987/locations/us-central1/ragCorpora/2305843009213693952"
+RAG_TOP_K              = 5
+RAG_DISTANCE_THRESHOLD = 0.5
+
+# Retrieval backend: "vertex" queries the corpus above over the network;
+# "local" searches an exported snapshot of it in-process (memory-mapped, so
+# worker processes share it). Rebuild the snapshot with
+# `python -m tools.build_rag_snapshot`.
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "vertex")
+RAG_INDEX_PATH    = os.getenv("RAG_INDEX_PATH", "rag_index")
+LOCAL_INDEX       = "rag-local-index"
+QUERY_EMBEDDER    = "rag-query-embedder"
+
+def _load_local_index():
+    from utils.vector_index import VectorIndex
+    return VectorIndex.load(RAG_INDEX_PATH)
+
+def _load_query_embedder():
+    # Queries must be embedded with the model the snapshot was built with
+    return vertex_embedding_model(get_model(LOCAL_INDEX).embedding_model)()
+
+if RETRIEVAL_BACKEND == "local":
+    register_model(LOCAL_INDEX, _load_local_index)
+    register_model(QUERY_EMBEDDER, _load_query_embedder)
+
+# Retrieval only depends on the drawing subject, so results are memoized per
+# (corpus, subject, top_k, threshold). Subjects listed in RAG_WARM_SUBJECTS
+# (comma separated) are fetched at startup.
+_retrieval_cache = TTLCache(
+    maxsize=int(os.getenv("RAG_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("RAG_CACHE_TTL", "3600")),
+)
+register_stats("rag_cache", _retrieval_cache.stats)
+# Concurrent misses for the same subject (e.g. a batch) share one retrieval
+_retrieval_inflight = SingleFlight()
+register_stats("rag_singleflight", _retrieval_inflight.stats)
+RAG_WARM_SUBJECTS = [s.strip() for s in os.getenv("RAG_WARM_SUBJECTS", "").split(",") if s.strip()]
+
+# ─── CLASSIFICATION MODE ───────────────────────────────────────────────────────
+# "generate" (default): the original free-form generation with the lenient
+# regex / keyword parser. "classify": schema-constrained JSON answer, small
+# token budget, temperature 0 and a strict parser (opt-in, since it changes
+# how safety-relevant input is classified).
+ANALYZE_MODE = os.getenv("ANALYZE_MODE", "generate")
+CLASSIFY_MAX_OUTPUT_TOKENS = int(os.getenv("ANALYZE_MAX_OUTPUT_TOKENS", "64"))
+
+# Optional cascade: when the fast model's answer doesn't parse or flags an
+# emergency, the same prompt goes to this (stronger) model. It settles the
+# emotion (or an unparseable answer), but never downgrades an emergency.
+CASCADE_MODEL_NAME = os.getenv("ANALYZE_CASCADE_MODEL", "")
+if CASCADE_MODEL_NAME:
+    register_model(CASCADE_MODEL_NAME, vertex_generative_model(CASCADE_MODEL_NAME))
+
+EMOTIONS   = ("positive", "depressed", "anxious", "angry")
+SEVERITIES = ("safe", "emergency")
+
+# 매핑 테이블: 내부 raw → 최종 반환값
+EMOTION_MAP = {
+    "positive": "HAPPY",
+    "depressed": "GLOOMY",
+    "anxious": "ANXIOUS",
+    "angry":   "ANGRY",
+}
+SEVERITY_MAP = {
+    "safe":      "SAFE",
+    "emergency": "EMERGENCY",
+}
+
+CLASSIFY_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "emotion":  {"type": "STRING", "enum": list(EMOTIONS)},
+        "severity": {"type": "STRING", "enum": list(SEVERITIES)},
+    },
+    "required": ["emotion", "severity"],
+}
 
-# Generation & safety settings
+ESCALATIONS = counter("dearmind_analyze_escalations_total", "Analyses re-run on the cascade model", ("reason",))
+
+# ─── RESULT CACHE ──────────────────────────────────────────────────────────────
+# Identical (image, subject, text) triples come back from retries/resubmits, so
+# results are cached by content hash. Bump PROMPT_VERSION whenever the prompt
+# or parsing changes so stale results are not served.
+PROMPT_VERSION = "3"
+_result_cache = ResultCache(
+    maxsize=int(os.getenv("ANALYZE_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("ANALYZE_CACHE_TTL", "86400")),
+    db_path=os.getenv("ANALYZE_CACHE_DB") or None,
+    max_rows=int(os.getenv("ANALYZE_CACHE_DB_MAX_ROWS", "100000")),
+)
+register_stats("analyze_cache", _result_cache.stats)
+
+# Concurrent identical requests (double taps, backend fan-out) share one model call
+_inflight = SingleFlight()
+register_stats("analyze_singleflight", _inflight.stats)
+
+# Opt-in hedging of the MODEL_NAME call (AI_HEDGE_ANALYZE=1, see utils.hedging)
+_hedger = Hedger("analyze")
+register_stats("analyze_hedging", _hedger.stats)
+
+# ─── BATCH ─────────────────────────────────────────────────────────────────────
+# /analyze/batch runs at most BATCH_CONCURRENCY items at a time (the model
+# limiter still paces the calls); each item gets BATCH_ITEM_DEADLINE seconds
+# instead of sharing the request deadline.
+BATCH_CONCURRENCY = int(os.getenv("ANALYZE_BATCH_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("ANALYZE_BATCH_MAX_ITEMS", "1000"))
+BATCH_ITEM_DEADLINE = float(os.getenv("ANALYZE_BATCH_ITEM_DEADLINE", "60"))
+
+# Generation settings (safety settings come from utils.models)
 generation_config = {
     "max_output_tokens": 8192,
     "temperature":       1,
     "top_p":             0.95,
 }
-safety_settings = {
-    generative_models.HarmCategory.HARM_CATEGORY_HATE_SPEECH:      generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-    generative_models.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-    generative_models.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-    generative_models.HarmCategory.HARM_CATEGORY_HARASSMENT:        generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-}
+
+# Output instructions appended to the prompt, per mode
+GENERATE_INSTRUCTION = (
+    "\n\n**EXACTLY** output _only_ a JSON array of two strings like [\"emotion\",\"severity\"] "
+    "where emotion ∈ {\"positive\",\"depressed\",\"anxious\",\"angry\"} and "
+    "severity ∈ {\"safe\",\"emergency\"}. NO OTHER TEXT or explanation."
+)
+CLASSIFY_INSTRUCTION = (
+    "\n\nAnswer with a JSON object {\"emotion\": ..., \"severity\": ...} "
+    "where emotion is one of positive, depressed, anxious, angry and "
+    "severity is safe or emergency."
+)
+
+# ─── RAG RETRIEVAL ─────────────────────────────────────────────────────────────
+
+def build_retrieval_prompt(subject: str) -> str:
+    return (
+        f"<context>Your role is an art therapist; my role is a client. "
+        f"You instructed me to draw {subject}.</context> "
+        "<question>What insight can you offer from art therapy theory? "
+        "Also judge if the client’s feelings are negative. "
+        "If negative, pick one: anxiety, depression, or anger.</question>"
+    )
+
+
+async def retrieve_context(
+    subject: str,
+    top_k: int = RAG_TOP_K,
+    threshold: float = RAG_DISTANCE_THRESHOLD,
+) -> str:
+    """
+    Returns the concatenated RAG chunks for `subject`, served from the
+    retrieval cache when possible.
+    """
+    with span("rag_retrieval"):
+        key = (RETRIEVAL_BACKEND, CORPUS_NAME, subject, top_k, threshold)
+        cached = _retrieval_cache.get(key)
+        if cached is not None:
+            return cached
+        return await _retrieval_inflight.do(key, _retrieve_uncached, key, subject, top_k, threshold)
+
+
+async def _retrieve_uncached(key: tuple, subject: str, top_k: int, threshold: float) -> str:
+    query = _local_query if RETRIEVAL_BACKEND == "local" else _rag_query
+    retrieved = await run_blocking(query, build_retrieval_prompt(subject), top_k, threshold)
+    _retrieval_cache.set(key, retrieved)
+    return retrieved
+
+
+def _rag_query(text: str, top_k: int, threshold: float) -> str:
+    init_vertexai()
+    from vertexai.preview import rag
+
+    rr = rag.retrieval_query(
+        rag_resources=[rag.RagResource(rag_corpus=CORPUS_NAME)],
+        text=text,
+        similarity_top_k=top_k,
+        vector_distance_threshold=threshold,
+    )
+    return " ".join([c.text for c in rr.contexts.contexts])
+
+
+def _local_query(text: str, top_k: int, threshold: float) -> str:
+    index = get_model(LOCAL_INDEX)
+    # Query embeddings of known subjects ship with the snapshot; others cost one embedding call
+    vector = index.query_vector(text)
+    if vector is None:
+        vector = embed_texts(get_model(QUERY_EMBEDDER), [text], "RETRIEVAL_QUERY")[0]
+    return " ".join(index.search_texts(vector, top_k, threshold))
+
+
+async def warm_retrieval_cache(subjects: Iterable[str]) -> None:
+    """
+    Pre-fetches retrieval results for known subjects. Failures are logged, not raised.
+    """
+    subjects = list(subjects)
+    results = await asyncio.gather(
+        *(retrieve_context(s) for s in subjects), return_exceptions=True
+    )
+    for subject, res in zip(subjects, results):
+        if isinstance(res, Exception):
+            logger.warning("RAG warm-up failed for subject %r: %s", subject, res)
+
+
+def analysis_key(image_bytes: bytes, subject: str, writing_text: Optional[str]) -> str:
+    h = hashlib.sha256(image_bytes)
+    for field in (subject, writing_text or "", MODEL_NAME, PROMPT_VERSION, ANALYZE_MODE, CASCADE_MODEL_NAME):
+        h.update(b"\0" + field.encode("utf-8"))
+    return h.hexdigest()
+
+
+def result_cache_stats() -> dict:
+    return _result_cache.stats()
+
 
 # ─── CORE LOGIC ────────────────────────────────────────────────────────────────
 
-def extract_emotion_severity(output: str) -> tuple[str, str]:
+def extract_emotion_severity(output: str) -> tuple[str, str, bool]:
     """
     Parse out a JSON array ["emotion","severity"] from the model output.
     Fall back to a simple keyword scan if parsing fails.
     Internally uses lowercase emotion/severity, but returns uppercase mapped values.
+    The last item is False when neither matched and the defaults were returned.
     """
     # 1) Strict JSON array match
     m = re.search(
@@ -52,13 +262,13 @@ def extract_emotion_severity(output: str) -> tuple[str, str]:
         output,
         flags=re.IGNORECASE
     )
+    found = m is not None
     if m:
         raw_emo = m.group("emotion").lower()
         raw_sev = m.group("severity").lower()
     else:
         # 2) Keyword fallback
         low = output.lower()
-        found = False
         for emo in ("positive","depressed","anxious","angry"):
             if emo in low:
                 raw_emo = emo
@@ -69,23 +279,89 @@ def extract_emotion_severity(output: str) -> tuple[str, str]:
             # 3) Default
             raw_emo, raw_sev = "positive", "safe"
 
-    # 매핑 테이블: 내부 raw → 최종 반환값
-    EMOTION_MAP = {
-        "positive": "HAPPY",
-        "depressed": "GLOOMY",
-        "anxious": "ANXIOUS",
-        "angry":   "ANGRY",
-    }
-    SEVERITY_MAP = {
-        "safe":      "SAFE",
-        "emergency": "EMERGENCY",
-    }
-
     # 최종 반환은 매핑된 대문자 값
-    return EMOTION_MAP.get(raw_emo, raw_emo.upper()), SEVERITY_MAP.get(raw_sev, raw_sev.upper())
+    return EMOTION_MAP.get(raw_emo, raw_emo.upper()), SEVERITY_MAP.get(raw_sev, raw_sev.upper()), found
+
+
+def parse_classification(output: str) -> Optional[tuple[str, str]]:
+    """
+    Strict parser for classification mode: the output must be exactly the
+    schema's JSON object. Returns the mapped (emotion, severity), or None.
+    """
+    try:
+        data = json.loads(output)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    emotion, severity = data.get("emotion"), data.get("severity")
+    if emotion not in EMOTIONS or severity not in SEVERITIES:
+        return None
+    return EMOTION_MAP[emotion], SEVERITY_MAP[severity]
+
+
+@functools.lru_cache(maxsize=None)
+def classify_config():
+    from vertexai.preview.generative_models import GenerationConfig
+    return GenerationConfig(
+        temperature=0,
+        max_output_tokens=CLASSIFY_MAX_OUTPUT_TOKENS,
+        response_mime_type="application/json",
+        response_schema=CLASSIFY_SCHEMA,
+    )
+
+
+async def _generate_text(model_name: str, parts: list, config) -> str:
+    model = await get_model_async(model_name)
+    response = await call_model(
+        model_name,
+        model.generate_content_async,
+        parts,
+        generation_config=config,
+        safety_settings=vertex_safety_settings(),
+        stream=False,
+    )
+    return getattr(response, "text", None) or response.candidates[0].content.text
 
 
-def analyze_diary(
+async def classify(parts: list) -> tuple[str, str, bool]:
+    """
+    Classification mode: asks MODEL_NAME for the schema-constrained answer and,
+    with a cascade model configured, escalates unparseable or emergency answers.
+    EMERGENCY is kept if either model reports it. Returns (emotion, severity,
+    parsed), parsed being False when no answer could be parsed.
+    """
+    raw = await _hedger.run(lambda: _generate_text(MODEL_NAME, parts, classify_config()))
+    parsed = parse_classification(raw)
+    emergency = SEVERITY_MAP["emergency"]
+    if parsed is None:
+        reason = "unparseable"
+    elif parsed[1] == emergency:
+        reason = "emergency"
+    else:
+        return parsed + (True,)
+    # Constrained output should always parse; fall back to the lenient parser if not
+    first = parsed + (True,) if parsed else extract_emotion_severity(raw)
+    if not CASCADE_MODEL_NAME:
+        return first
+
+    ESCALATIONS.inc(reason=reason)
+    logger.info("Escalating analysis to %s (%s)", CASCADE_MODEL_NAME, reason)
+    cascade_raw = await _generate_text(CASCADE_MODEL_NAME, parts, classify_config())
+    cascaded = parse_classification(cascade_raw)
+    if cascaded is not None:
+        emotion, severity, ok = cascaded + (True,)
+    else:
+        emotion, severity, ok = extract_emotion_severity(cascade_raw)
+        if first[2]:
+            # Nothing settled: keep the first emotion, but an emergency in the cascade's text still counts
+            emotion = first[0]
+    if first[1] == emergency:
+        severity = emergency
+    return emotion, severity, ok or first[2]
+
+
+async def analyze_diary(
     image_b64: str,
     subject: str,
     writing_text: Optional[str] = None
@@ -94,56 +370,112 @@ def analyze_diary(
     Decode the image, do RAG+multimodal generation, parse emotion+severity,
     and return an object with .emotion and .severity.
     """
+    with span("base64_decode"):
+        image_bytes = base64.b64decode(image_b64)
+    return await analyze_image(image_bytes, subject, writing_text)
 
-    # ── 1) Decode the image part from Base64 ────────────────────────────────────
-    image_bytes = base64.b64decode(image_b64)
-    image_part  = Part.from_data(data=image_bytes, mime_type="image/png")
 
-    # ── 2) Text-only retrieval from your RAG corpus ───────────────────────────
-    retrieval_prompt = (
-        f"<context>Your role is an art therapist; my role is a client. "
-        f"You instructed me to draw {subject}.</context> "
-        "<question>What insight can you offer from art therapy theory? "
-        "Also judge if the client’s feelings are negative. "
-        "If negative, pick one: anxiety, depression, or anger.</question>"
-    )
-    rr = rag.retrieval_query(
-        rag_resources=[rag.RagResource(rag_corpus=CORPUS_NAME)],
-        text=retrieval_prompt,
-        similarity_top_k=5,
-        vector_distance_threshold=0.5,
-    )
-    retrieved = " ".join([c.text for c in rr.contexts.contexts])
-
-    # ── 3) Build the final multimodal prompt ─────────────────────────────────
-    final_prompt = (
-        retrieval_prompt +
-        "\n\nAdditional Context from Retrieval:\n" +
-        retrieved +
-        "\n\nNow interpret the attached artwork and writing." +
-        "\nAnd if you detect any negative feelings, suggest if the client shows "
-        "a tendency toward suicidal or self-harm—only if you’re quite sure." +
-        "\n\n**EXACTLY** output _only_ a JSON array of two strings like [\"emotion\",\"severity\"] "
-        "where emotion ∈ {\"positive\",\"depressed\",\"anxious\",\"angry\"} and "
-        "severity ∈ {\"safe\",\"emergency\"}. NO OTHER TEXT or explanation."
-    )
+async def analyze_image(
+    image_bytes: bytes,
+    subject: str,
+    writing_text: Optional[str] = None
+) -> SimpleNamespace:
+    """
+    Same as analyze_diary, for raw image bytes (multipart / binary uploads).
+    Repeated inputs are answered from the result cache, and identical inputs
+    already being analyzed wait for that analysis instead of starting another.
+    """
+    # hashing a multi-MB image is done off the event loop
+    with span("result_cache"):
+        key = await run_blocking(analysis_key, image_bytes, subject, writing_text)
+        cached = await _result_cache.aget(key)
+    if cached is not None:
+        return SimpleNamespace(**cached)
+    return await _inflight.do(key, _analyze_uncached, key, image_bytes, subject, writing_text)
 
-    # ── 4) Assemble Parts & call the model ────────────────────────────────────
-    parts = [final_prompt, image_part]
-    if writing_text:
-        try:
-            parts.append(Part.from_text(writing_text))
-        except AttributeError:
-            parts.append(writing_text)
 
-    response = model.generate_content(
-        parts,
-        generation_config=generation_config,
-        safety_settings=safety_settings,
-        stream=False,
-    )
-    raw = getattr(response, "text", None) or response.candidates[0].content.text
+async def analyze_batch(
+    items: Sequence[Tuple[Union[str, bytes], str, Optional[str]]],
+    concurrency: int = BATCH_CONCURRENCY
+) -> AsyncIterator[Tuple[int, Union[SimpleNamespace, Exception]]]:
+    """
+    Analyzes (image, subject, text) items, images as base64 strings or raw
+    bytes, with at most `concurrency` in flight. Yields (index, result) in
+    completion order; a failed item yields (index, exception) and the batch
+    goes on. Items with the same subject share one retrieval.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(i: int, image: Union[str, bytes], subject: str, writing_text: Optional[str]):
+        async with semaphore:
+            # Runs in its own task, so the deadline only applies to this item
+            set_deadline(BATCH_ITEM_DEADLINE)
+            try:
+                if isinstance(image, bytes):
+                    return i, await analyze_image(image, subject, writing_text)
+                return i, await analyze_diary(image, subject, writing_text)
+            except Exception as e:
+                logger.warning("Batch item %d failed: %s", i, e)
+                return i, e
+
+    tasks = [asyncio.ensure_future(run(i, *item)) for i, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Client went away (or the consumer stopped): drop what's left
+        for task in tasks:
+            task.cancel()
+
+
+async def _analyze_uncached(
+    key: str,
+    image_bytes: bytes,
+    subject: str,
+    writing_text: Optional[str]
+) -> SimpleNamespace:
+    # Building the model first also imports the Vertex SDK off the event loop
+    await get_model_async(MODEL_NAME)
+    from vertexai.preview.generative_models import Part
 
-    # ── 5) Parse out emotion + severity ───────────────────────────────────────
-    emotion, severity = extract_emotion_severity(raw)
+    # ── 1) Build the image part (downscaled / re-encoded if needed) ───────────
+    image_bytes, mime_type = await normalize_image_async(image_bytes)
+    image_part  = Part.from_data(data=image_bytes, mime_type=mime_type)
+
+    # ── 2) Text-only retrieval from your RAG corpus (memoized per subject) ──
+    retrieval_prompt = build_retrieval_prompt(subject)
+    retrieved = await retrieve_context(subject)
+
+    with span("prompt_build"):
+        # ── 3) Build the final multimodal prompt ─────────────────────────────────
+        final_prompt = (
+            retrieval_prompt +
+            "\n\nAdditional Context from Retrieval:\n" +
+            retrieved +
+            "\n\nNow interpret the attached artwork and writing." +
+            "\nAnd if you detect any negative feelings, suggest if the client shows "
+            "a tendency toward suicidal or self-harm—only if you’re quite sure." +
+            (CLASSIFY_INSTRUCTION if ANALYZE_MODE == "classify" else GENERATE_INSTRUCTION)
+        )
+
+        # ── 4) Assemble Parts ─────────────────────────────────────────────────────
+        parts = [final_prompt, image_part]
+        if writing_text:
+            try:
+                parts.append(Part.from_text(writing_text))
+            except AttributeError:
+                parts.append(writing_text)
+
+    # ── 5) Call the model & parse out emotion + severity ─────────────────────
+    if ANALYZE_MODE == "classify":
+        emotion, severity, parsed = await classify(parts)
+    else:
+        raw = await _hedger.run(lambda: _generate_text(MODEL_NAME, parts, generation_config))
+        emotion, severity, parsed = extract_emotion_severity(raw)
+    # The defaults stand in for an answer the model didn't give; caching them
+    # would keep a retry of the same drawing from ever being re-assessed
+    if parsed:
+        await _result_cache.aset(key, {"emotion": emotion, "severity": severity})
+    else:
+        logger.warning("Analysis output could not be parsed; result not cached")
     return SimpleNamespace(emotion=emotion, severity=severity)
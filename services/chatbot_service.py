@@ -1,19 +1,35 @@
 import os
-from typing import List
-from google import genai
-from google.genai.types import GenerateContentConfig, Content, Part as GenaiPart
-from utils.utils import fetch_chat_history, fetch_diary_by_date
+import time
+import asyncio
+import hashlib
+import weakref
+from types import SimpleNamespace
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from utils.utils import fetch_chat_context
+from utils.cache import TTLCache
+from utils.concurrency import call_model, model_slot
+from utils.hedging import Hedger
+from utils.models import PROJECT_ID, REGION, get_model_async, register_model
+from utils.session_store import SessionStore
+from utils.metrics import MODEL_SECONDS, counter, register_stats, span
+from utils.prompt_budget import RollingSummarizer, count_tokens, fit_entries, newest_within
 
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# ─── INIT GENAI CLIENT ─────────────────────────────────────────────────────────
-PROJECT_ID = "sc2025-test"
-REGION     = "us-central1"
+# ─── GENAI CLIENT (built lazily on first use) ──────────────────────────────────
+# The google-genai SDK is only imported in here and in the helpers below, which
+# all run after the client was built (on the worker pool), so startup doesn't pay for it.
+GENAI_CLIENT = "genai-client"
 
-client = genai.Client(vertexai=True, project=PROJECT_ID, location=REGION)
+def _genai_client():
+    from google import genai
+    return genai.Client(vertexai=True, project=PROJECT_ID, location=REGION)
+
+register_model(GENAI_CLIENT, _genai_client)
+CHAT_MODEL_NAME = "gemini-2.0-flash"
 
 # ─── BOT PERSONA & GREETING ────────────────────────────────────────────────────
 SYSTEM_INSTRUCTION = (
@@ -27,6 +43,79 @@ STATIC_GREETING = (
     "How can I support you with your feelings today?"
 )
 
+# ─── SESSION CACHE ─────────────────────────────────────────────────────────────
+# Live chat objects are kept per user so a turn only has to add what is new
+# since the previous one, instead of rebuilding the whole history.
+_sessions = SessionStore(
+    max_sessions=int(os.getenv("CHAT_SESSION_MAX", "1000")),
+    max_bytes=int(os.getenv("CHAT_SESSION_MAX_BYTES", str(64 * 1024 * 1024))),
+    idle_ttl=float(os.getenv("CHAT_SESSION_IDLE_TTL", "1800")),
+)
+register_stats("chat_sessions", _sessions.stats)
+_user_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+# ─── PROMPT BUDGET ─────────────────────────────────────────────────────────────
+# The chat only holds the newest turns verbatim. Once they exceed
+# CHAT_HISTORY_TOKENS, the oldest are folded into a rolling summary until half
+# the budget is left, so summaries are recomputed once every few turns rather
+# than on every turn. Today's diaries get their own budget the same way.
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "2000"))
+CHAT_DIARY_TOKENS   = int(os.getenv("CHAT_DIARY_TOKENS", "1000"))
+SUMMARY_TOKENS      = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "256"))
+
+# ─── CONTEXT PREFETCH ──────────────────────────────────────────────────────────
+# /chat/init starts loading the user's context (history, diaries and the chat
+# session) in the background. The first chat turn within CHAT_PREFETCH_TTL
+# seconds takes it from this slot instead of fetching it again.
+CHAT_PREFETCH_TTL = float(os.getenv("CHAT_PREFETCH_TTL", "30"))
+_prefetched = TTLCache(maxsize=int(os.getenv("CHAT_PREFETCH_MAX", "1000")), ttl=CHAT_PREFETCH_TTL)
+_prefetching: Dict[str, asyncio.Task] = {}
+register_stats("chat_prefetch", lambda: {"warm": len(_prefetched), "in_flight": len(_prefetching)})
+PREFETCH = counter("dearmind_chat_prefetch_total", "Chat turns by prefetched context use", ("result",))
+
+# Opt-in hedging of /chat replies (AI_HEDGE_CHAT=1, see utils.hedging)
+_hedger = Hedger("chat")
+register_stats("chat_hedging", _hedger.stats)
+
+Turn = Tuple[str, str]  # (genai role, text)
+
+
+class _ChatSession:
+    """
+    A live chat plus the turns it already holds, in the same order as the backend.
+    `turns` mirrors the backend history (used to find what is new); the chat
+    itself holds only `window`, the newest turns, with older ones in `summary`.
+    """
+
+    def __init__(self, system: str, turns: List[Turn]):
+        self.system = system
+        self.summary = ""
+        self.turns = list(turns)
+        self.window = list(turns)
+        self.contents = _to_contents(self.window)
+        self.chat = None
+
+    @property
+    def size(self) -> int:
+        return (len(self.system) + len(self.summary)
+                + sum(len(text) for _, text in self.turns) + sum(len(text) for _, text in self.window))
+
+    @property
+    def instruction(self) -> str:
+        if not self.summary:
+            return self.system
+        return self.system + "\n\nSummary of the earlier conversation:\n" + self.summary
+
+    def extend(self, turns: List[Turn]) -> None:
+        self.turns.extend(turns)
+        self.window.extend(turns)
+        self.contents.extend(_to_contents(turns))
+
+    def record(self, user_message: str, reply: str) -> None:
+        # The chat object records the exchange itself; keep our mirror in step
+        self.extend([("user", user_message), ("model", reply)])
+
+
 def get_initial_greeting() -> str:
     """
     Returns the one‐time greeting shown when the user first opens the chat.
@@ -34,52 +123,245 @@ def get_initial_greeting() -> str:
     """
     return STATIC_GREETING
 
-def chat_with_history(user_message: str, token: str) -> str:
+def _session_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def _user_lock(key: str) -> asyncio.Lock:
+    lock = _user_locks.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        _user_locks[key] = lock
+    return lock
+
+def _to_turns(history_json) -> List[Turn]:
+    # Gemini expects "user" or "model"
+    return [("user" if t["role"] == "user" else "model", t["content"]) for t in history_json]
+
+def _to_contents(turns: List[Turn]) -> list:
+    from google.genai.types import Content, Part
+    return [Content(role=role, parts=[Part(text=text)]) for role, text in turns]
+
+def _known_prefix(known: List[Turn], fetched: List[Turn]) -> Optional[int]:
     """
-    1) Fetch prior chat turns (up to ~20) from external service.
-    2) Fetch today’s diary entries and inject them into the system context.
-    3) If no prior turns, return a static greeting.
-    4) Otherwise start a Gemini chat with both persona+diary context and history baked in,
-       then send the new user message and return the assistant’s reply.
-    """
-    # 1) Fetch chat history
-    history_json = fetch_chat_history(token=token)
-    print("breakpoint: fetch history: ", history_json)
-    # 2) Always fetch today’s diary and append to system context
-    diaries = fetch_diary_by_date(token=token)
-    print("breakpoint: fetch diary: ", diaries)
-    diary_block = "\n".join(f"- {d}" for d in diaries)
-    print("breakpoint: parse diary result: ", diary_block)
+    Returns how many leading `fetched` turns the session already holds, or None
+    if the two histories don't line up. The backend may return a sliding window
+    (older turns dropped) or lag behind the turns sent through this session.
+    """
+    if not known:
+        return 0
+    if not fetched:
+        return None
+    for start in range(len(known)):
+        n = min(len(known) - start, len(fetched))
+        if known[start:start + n] == fetched[:n]:
+            return n
+    return None
+
+async def _summarize(prompt: str) -> str:
+    client = await get_model_async(GENAI_CLIENT)
+    from google.genai.types import GenerateContentConfig
+    response = await call_model(
+        CHAT_MODEL_NAME,
+        client.aio.models.generate_content,
+        model=CHAT_MODEL_NAME,
+        contents=prompt,
+        config=GenerateContentConfig(max_output_tokens=SUMMARY_TOKENS, temperature=0.2),
+    )
+    return response.text or ""
+
+_history_summaries = RollingSummarizer("chat_history", _summarize, max_tokens=SUMMARY_TOKENS)
+_diary_summaries   = RollingSummarizer("chat_diary", _summarize, max_tokens=SUMMARY_TOKENS)
+register_stats("chat_summaries", _history_summaries.stats)
+
+async def _build_system(diaries: List[str]) -> str:
+    # Diaries that don't fit the budget are summarized (cached, so the system
+    # instruction stays identical between turns and the session is reused)
+    summary, recent = await fit_entries(diaries, CHAT_DIARY_TOKENS, _diary_summaries)
     extended_system = SYSTEM_INSTRUCTION
-    if diary_block:
-        extended_system += "\n\nUser's diary for today:\n" + diary_block
-
-
-    # 4) Map history into GenAI Content objects
-    history: List[Content] = []
-    for turn in history_json:
-        role = turn["role"]
-        # Gemini expects "user" or "model"
-        genai_role = "user" if role == "user" else "model"
-        history.append(
-            Content(
-                role=genai_role,
-                parts=[GenaiPart(text=turn["content"])]
-            )
-        )
+    if summary or recent:
+        extended_system += "\n\nUser's diary for today:"
+        if summary:
+            extended_system += "\n(earlier entries, summarized) " + summary
+        extended_system += "".join(f"\n- {d}" for d in recent)
+    return extended_system
 
-    print("breakpoint: append history")
+def _create_chat(client, system: str, contents: list):
+    from google.genai.types import GenerateContentConfig
+    return client.aio.chats.create(
+        model=CHAT_MODEL_NAME,
+        config=GenerateContentConfig(system_instruction=system),
+        history=contents
+    )
 
-    # 5) Start a new chat with persona+diary context + prior history
-    chat = client.chats.create(
-        model="gemini-2.0-flash",
-        config=GenerateContentConfig(system_instruction=extended_system),
-        history=history
+async def _load_context(token: str) -> SimpleNamespace:
+    """
+    1) Fetch prior chat turns (up to ~20) from external service.
+    2) Fetch today’s diary entries and fold them into the system context.
+    """
+    history_json, diaries = await fetch_chat_context(token=token)
+    logger.debug("chat context: %d history turns, %d diary entries", len(history_json), len(diaries))
+    client = await get_model_async(GENAI_CLIENT)
+    return SimpleNamespace(
+        key=_session_key(token),
+        client=client,
+        system=await _build_system(diaries),
+        turns=_to_turns(history_json),
     )
 
-    print("breakpoint: initiate chat session")
+def prefetch_context(token: str) -> None:
+    """
+    Starts loading the user's chat context and session in the background
+    (at most one load per user at a time). Failures are logged, not raised.
+    """
+    key = _session_key(token)
+    if key in _prefetching or _prefetched.get(key) is not None:
+        return
+    task = asyncio.ensure_future(_prefetch(token))
+    _prefetching[key] = task
+    task.add_done_callback(lambda t, key=key: _prefetch_done(key, t))
+
+async def _prefetch(token: str) -> SimpleNamespace:
+    ctx = await _load_context(token)
+    async with _user_lock(ctx.key):
+        session = _sync_session(ctx)
+        await _compact_session(ctx, session)
+        _sessions.put(ctx.key, session, session.size)
+    _prefetched.set(ctx.key, ctx)
+    return ctx
+
+def _prefetch_done(key: str, task: asyncio.Task) -> None:
+    _prefetching.pop(key, None)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("chat context prefetch failed: %s", task.exception())
+
+async def _context_for(token: str) -> SimpleNamespace:
+    """
+    The context prefetched by /chat/init if it is still warm (each prefetch is
+    used once), waiting for one that is still loading; else _load_context.
+    """
+    key = _session_key(token)
+    ctx = _prefetched.pop(key)
+    if ctx is not None:
+        PREFETCH.inc(result="hit")
+        return ctx
+    task = _prefetching.get(key)
+    if task is not None:
+        try:
+            # shield: a cancelled turn must not cancel the prefetch
+            ctx = await asyncio.shield(task)
+            _prefetched.pop(key)
+            PREFETCH.inc(result="joined")
+            return ctx
+        except Exception:
+            pass  # already logged by _prefetch_done; load it here instead
+    PREFETCH.inc(result="miss")
+    return await _load_context(token)
+
+def _sync_session(ctx: SimpleNamespace) -> _ChatSession:
+    """
+    3) Bring the cached session up to date with the fetched history.
+       Only new turns are converted and appended; a cache miss or a history /
+       diary mismatch falls back to a full rebuild. Call with the user lock held.
+    """
+    with span("prompt_build"):
+        return _sync_session_locked(ctx)
+
+def _sync_session_locked(ctx: SimpleNamespace) -> _ChatSession:
+    session = _sessions.get(ctx.key)
+    if session is not None and session.system == ctx.system:
+        known = _known_prefix(session.turns, ctx.turns)
+        if known is not None:
+            new_turns = ctx.turns[known:]
+            if new_turns:
+                session.extend(new_turns)
+                session.chat = _create_chat(ctx.client, session.instruction, session.contents)
+            # The mirror only has to reach back as far as the backend's window (plus lag)
+            del session.turns[:-(len(ctx.turns) + 8)]
+            return session
 
-    # 6) Send the new user message
-    response = chat.send_message(user_message)
-    print("breakpoint: generate response")
+    session = _ChatSession(ctx.system, ctx.turns)
+    session.chat = _create_chat(ctx.client, session.instruction, session.contents)
+    logger.debug("chat session rebuilt (%d turns)", len(ctx.turns))
+    return session
+
+async def _compact_session(ctx: SimpleNamespace, session: _ChatSession) -> None:
+    """
+    Keeps the verbatim window within CHAT_HISTORY_TOKENS by folding its oldest
+    turns into the session's rolling summary. Call with the user lock held.
+    """
+    texts = [text for _, text in session.window]
+    if sum(count_tokens(t) for t in texts) <= CHAT_HISTORY_TOKENS:
+        return
+    start = newest_within(texts, CHAT_HISTORY_TOKENS // 2)
+    # Start the window on a user turn
+    while start < len(session.window) and session.window[start][0] != "user":
+        start += 1
+    evicted = [f"{'User' if role == 'user' else 'Assistant'}: {text}" for role, text in session.window[:start]]
+    session.summary = await _history_summaries.fold(session.summary, evicted)
+    del session.window[:start]
+    del session.contents[:start]
+    session.chat = _create_chat(ctx.client, session.instruction, session.contents)
+    logger.debug("chat history compacted: %d turns summarized, %d kept", start, len(session.window))
+
+async def _send(chat, user_message: str):
+    return chat, await call_model(CHAT_MODEL_NAME, chat.send_message, user_message)
+
+async def chat_with_history(user_message: str, token: str) -> str:
+    """
+    Syncs the user's chat session (see _load_context / _sync_session), sends
+    the new user message and returns the assistant’s reply.
+    """
+    ctx = await _context_for(token)
+    async with _user_lock(ctx.key):
+        session = _sync_session(ctx)
+        await _compact_session(ctx, session)
+
+        # 4) Send the new user message. A chat records every exchange sent
+        #    through it, so a hedge goes to a fresh chat with the same history
+        #    and the session keeps whichever chat answered first.
+        try:
+            session.chat, response = await _hedger.run(
+                lambda: _send(session.chat, user_message),
+                lambda: _send(_create_chat(ctx.client, session.instruction, session.contents), user_message),
+            )
+        except BaseException:
+            # The chat may be half-updated; start from scratch next turn
+            _sessions.discard(ctx.key)
+            raise
+        session.record(user_message, response.text)
+        _sessions.put(ctx.key, session, session.size)
     return response.text
+
+
+async def stream_chat_with_history(user_message: str, token: str) -> AsyncIterator[str]:
+    """
+    Streaming variant of chat_with_history.
+    Backend fetches happen before this returns, so those errors surface to the
+    caller before any bytes are sent; the returned iterator yields reply text
+    chunks as Gemini produces them.
+    """
+    ctx = await _context_for(token)
+    return _stream_reply(ctx, user_message)
+
+async def _stream_reply(ctx: SimpleNamespace, user_message: str) -> AsyncIterator[str]:
+    async with _user_lock(ctx.key):
+        session = _sync_session(ctx)
+        await _compact_session(ctx, session)
+        reply = []
+        start = time.perf_counter()
+        try:
+            # The model slot is held for the whole stream, since the call is in flight until the last chunk
+            async with model_slot(CHAT_MODEL_NAME):
+                with span("model_call"):
+                    stream = await session.chat.send_message_stream(user_message)
+                    async for chunk in stream:
+                        if chunk.text:
+                            reply.append(chunk.text)
+                            yield chunk.text
+        except BaseException:
+            MODEL_SECONDS.observe(time.perf_counter() - start, model=CHAT_MODEL_NAME, outcome="error")
+            _sessions.discard(ctx.key)
+            raise
+        MODEL_SECONDS.observe(time.perf_counter() - start, model=CHAT_MODEL_NAME, outcome="ok")
+        session.record(user_message, "".join(reply))
+        _sessions.put(ctx.key, session, session.size)
@@ -3,162 +3,324 @@
 import os
 import base64
 import re
-import tempfile
-from io import BytesIO
+import hashlib
+import ipaddress
+import asyncio
+import logging
 from types import SimpleNamespace
-from typing import Optional
-
-import vertexai
-from vertexai.preview.vision_models import ImageGenerationModel
-from vertexai.preview.generative_models import GenerativeModel, Part
-import vertexai.preview.generative_models as generative_models
-from time import sleep
+from typing import Optional, Tuple, Union
+from urllib.parse import urlsplit
 
 from PIL import Image
-import requests
 
-# ─── CONFIG & INIT (run once per process) ───────────────────────────────────────
-PROJECT_ID = "sc2025-test"
-REGION     = "us-central1"
+from utils.concurrency import call_model, run_blocking
+from utils.images import IMAGE_QUALITY, encode_image, normalize_image_async, sniff_mime
+from utils.job_queue import JobQueue
+from utils.metrics import register_stats, span
+from utils.prompt_budget import RollingSummarizer, fit_entries
+from utils.singleflight import SingleFlight
+from utils.utils import session as http_session
+from utils.models import (
+    get_model_async,
+    register_model,
+    vertex_generative_model,
+    vertex_image_model,
+    vertex_safety_settings,
+)
 
-vertexai.init(project=PROJECT_ID, location=REGION)
+logger = logging.getLogger(__name__)
 
-# Preload both Imagen variants
-IMAGE_MODEL_002 = ImageGenerationModel.from_pretrained("imagegeneration@002")
-IMAGE_MODEL_006 = ImageGenerationModel.from_pretrained("imagegeneration@006")
+# ─── MODELS (built lazily on first use) ────────────────────────────────────────
+# Both Imagen variants
+IMAGE_MODEL_002 = "imagegeneration@002"
+IMAGE_MODEL_006 = "imagegeneration@006"
+register_model(IMAGE_MODEL_002, vertex_image_model(IMAGE_MODEL_002))
+register_model(IMAGE_MODEL_006, vertex_image_model(IMAGE_MODEL_006))
 
 # Gemini for letter generation
-TEXT_MODEL = GenerativeModel("gemini-2.0-flash")
+TEXT_MODEL_NAME = "gemini-2.0-flash"
+register_model(TEXT_MODEL_NAME, vertex_generative_model(TEXT_MODEL_NAME))
 
-# Text safety & generation settings
+# Text generation settings (safety settings come from utils.models)
 GEN_TEXT_CFG = {"max_output_tokens": 150, "temperature": 0.8, "top_p": 0.9}
-SAFETY = {
-    generative_models.HarmCategory.HARM_CATEGORY_HATE_SPEECH:       generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-    generative_models.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-    generative_models.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-    generative_models.HarmCategory.HARM_CATEGORY_HARASSMENT:        generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-}
+
+# Diaries beyond REWARD_DIARY_TOKENS are folded into a (cached) summary
+REWARD_DIARY_TOKENS = int(os.getenv("REWARD_DIARY_TOKENS", "800"))
+SUMMARY_TOKENS      = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "256"))
+
+# Concurrent identical reward requests share one Imagen + Gemini run
+_inflight = SingleFlight()
+register_stats("reward_singleflight", _inflight.stats)
+
+
+# ─── HELPERS ───────────────────────────────────────────────────────────────────
+async def _summarize(prompt: str) -> str:
+    text_model = await get_model_async(TEXT_MODEL_NAME)
+    resp = await call_model(
+        TEXT_MODEL_NAME,
+        text_model.generate_content_async,
+        prompt,
+        generation_config={"max_output_tokens": SUMMARY_TOKENS, "temperature": 0.2},
+        safety_settings=vertex_safety_settings(),
+        stream=False
+    )
+    return getattr(resp, "text", None) or resp.candidates[0].content.text
+
+_diary_summaries = RollingSummarizer("reward_diary", _summarize, max_tokens=SUMMARY_TOKENS)
+register_stats("reward_summaries", _diary_summaries.stats)
+
+
+def _encode_reward_image(reward_img, image_format: Optional[str], quality: int) -> Tuple[bytes, str]:
+    """
+    Returns (bytes, mime_type) of the generated image. The encoded bytes
+    Imagen returned are reused as they are unless another format is requested.
+    """
+    data = getattr(reward_img, "_image_bytes", None)
+    if data is None:
+        # reward_img 자체가 PIL 이미지이거나 .image 속성에 PIL 이미지가 담겨있는 경우
+        data = reward_img if isinstance(reward_img, Image.Image) else getattr(reward_img, "image", None)
+    if data is None:
+        raise RuntimeError("Image generation returned no image data")
+    return encode_image(data, image_format, quality)
+
+
+async def _generate_image(img_model_name: str, image_prompt: str, retry_attempts: int,
+                          image_format: Optional[str], quality: int) -> Tuple[bytes, str]:
+    """
+    Generates the reward painting and returns (bytes, mime_type).
+    Quota and transient errors are retried by call_model (up to `retry_attempts` attempts).
+    """
+    img_model = await get_model_async(img_model_name)
+    imgs = await call_model(
+        img_model_name,
+        img_model.generate_images,
+        prompt=image_prompt,
+        number_of_images=1,
+        add_watermark=False,
+        max_attempts=retry_attempts,
+    )
+    reward_img = imgs[0]
+
+    data = getattr(reward_img, "_image_bytes", None)
+    if data is not None and image_format is None:
+        # The model's own encoded bytes are used directly, no decode / re-encode
+        return data, sniff_mime(data)
+    # PIL work runs off the event loop
+    with span("image_encode"):
+        return await run_blocking(_encode_reward_image, reward_img, image_format, quality)
+
+
+async def _load_user_image(img_str: Union[str, bytes]) -> tuple[bytes, str]:
+    """
+    Returns (bytes, mime_type) of a user image given as URL, base64 or raw bytes,
+    normalized for upload (see utils.images).
+    """
+    try:
+        if isinstance(img_str, bytes):
+            # 바이너리 업로드인 경우 그대로 사용
+            img_bytes = img_str
+        elif img_str.startswith("http://") or img_str.startswith("https://"):
+            # URL 인 경우 HTTP GET (keep-alive 세션 재사용)
+            resp = await run_blocking(http_session.get, img_str, timeout=5)
+            resp.raise_for_status()
+            img_bytes = resp.content
+        else:
+            # Base64 인 경우 디코딩
+            img_bytes = base64.b64decode(img_str)
+    except Exception as e:
+        raise RuntimeError(f"사용자 이미지 처리 중 오류: {e}")
+    return await normalize_image_async(img_bytes)
+
+
+async def _generate_letter(letter_prompt: str, user_images: list[Union[str, bytes]]) -> str:
+    """
+    Loads the user's images concurrently and asks Gemini for the letter.
+    """
+    text_model = await get_model_async(TEXT_MODEL_NAME)
+    from vertexai.preview.generative_models import Part
+
+    images = await asyncio.gather(*(_load_user_image(s) for s in user_images))
+
+    parts = [Part.from_text(letter_prompt)]
+    parts.extend(Part.from_data(data=b, mime_type=mime) for b, mime in images)
+
+    resp = await call_model(
+        TEXT_MODEL_NAME,
+        text_model.generate_content_async,
+        parts,
+        generation_config=GEN_TEXT_CFG,
+        safety_settings=vertex_safety_settings(),
+        stream=False
+    )
+    return getattr(resp, "text", None) or resp.candidates[0].content.text
+
+
+def reward_key(
+    user_images: list[Union[str, bytes]],
+    art_style: str,
+    diaries: Optional[list[str]],
+    retry_attempts: int,
+    image_format: Optional[str] = None,
+    quality: int = IMAGE_QUALITY
+) -> str:
+    """
+    Content hash identifying a reward request.
+    """
+    h = hashlib.sha256()
+    for part in (art_style, str(retry_attempts), image_format or "", str(quality), *(diaries or [])):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    for img in user_images:
+        h.update(b"\x01")
+        h.update(img if isinstance(img, bytes) else img.encode("utf-8"))
+    return h.hexdigest()
 
 
 # ─── MAIN SERVICE FUNCTION ─────────────────────────────────────────────────────
-def generate_reward(
-    user_images: list[str],
+async def generate_reward(
+    user_images: list[Union[str, bytes]],
     art_style: str,
     diaries: Optional[list[str]] = None,
-    retry_attempts: int = 3
+    retry_attempts: int = 3,
+    image_format: Optional[str] = None,
+    quality: int = IMAGE_QUALITY
 ) -> SimpleNamespace:
     """
     Returns SimpleNamespace(
-        image_b64=<base64 PNG of the generated painting>,
+        image=<encoded bytes of the generated painting>,
+        mime_type=<MIME type of image>,
         letter=<generated congratulatory letter>
     )
+    `user_images` may be URLs, base64 strings or raw bytes.
+    `image_format` ("png", "jpeg", "webp") re-encodes the painting at `quality`;
+    by default the PNG bytes Imagen returned are passed through untouched.
+    Identical requests that arrive while one is being generated get its result.
     """
-    diaries = diaries or []
-    diary_snips = "\n".join(f"- {d}" for d in diaries)
+    # hashing multi-MB images is done off the event loop
+    key = await run_blocking(reward_key, user_images, art_style, diaries, retry_attempts, image_format, quality)
+    return await _inflight.do(
+        key, _generate_reward, user_images, art_style, diaries, retry_attempts, image_format, quality
+    )
+
+
+async def _generate_reward(
+    user_images: list[Union[str, bytes]],
+    art_style: str,
+    diaries: Optional[list[str]],
+    retry_attempts: int,
+    image_format: Optional[str],
+    quality: int
+) -> SimpleNamespace:
+    """
+    The painting and the letter don't depend on each other, so both model
+    calls run concurrently.
+    """
+    # Only the newest diaries go in verbatim; older ones are summarized
+    summary, recent = await fit_entries(diaries or [], REWARD_DIARY_TOKENS, _diary_summaries)
+    diary_snips = "\n".join(f"- {d}" for d in recent)
+    if summary:
+        diary_snips = f"- (earlier entries, summarized) {summary}\n" + diary_snips
 
     # 1) Choose which Imagen model based on style
     if art_style in ("watercolor", "oil_painting"):
-        img_model = IMAGE_MODEL_002
+        img_model_name = IMAGE_MODEL_002
     else:
-        img_model = IMAGE_MODEL_006
-
-    # 2) Build the image prompt
-    image_prompt = (
-        "Create an inspirational painting in "
-        f"{art_style}.\n"
-        "Include motifs that reflect soothing vibe if appropriate. "
-        "Do not draw overly abstract pictures. "
-        "Avoid portrait of a person. "
-        "Also try to reflect user's emotions (not the direct anecdotes but the emotions) from their recent diary entries. Here are some of them\n"
-        f"{diary_snips}"
-    )
+        img_model_name = IMAGE_MODEL_006
 
-    # 3) Generate (with retry)
-    for attempt in range(1, retry_attempts+1):
-        try:
-            imgs = img_model.generate_images(
-                prompt=image_prompt,
-                number_of_images=1,
-                add_watermark=False
-            )
-            reward_img = imgs[0]
-            break
-        except Exception as e:
-            if attempt == retry_attempts:
-                raise RuntimeError(f"Image generation failed after {retry_attempts} attempts: {e}")
-            sleep(1)  # back-off briefly
-
-    # 4) Encode the reward image to base64
-    img_bytes = None
-
-    # reward_img 자체가 PIL 이미지인 경우
-    if isinstance(reward_img, Image.Image):
-        pil_img = reward_img
-
-    # reward_img.image 속성에 PIL 이미지가 담겨있는 경우
-    elif hasattr(reward_img, "image") and isinstance(reward_img.image, Image.Image):
-        pil_img = reward_img.image
+    with span("prompt_build"):
+        # 2) Build the image prompt
+        image_prompt = (
+            "Create an inspirational painting in "
+            f"{art_style}.\n"
+            "Include motifs that reflect soothing vibe if appropriate. "
+            "Do not draw overly abstract pictures. "
+            "Avoid portrait of a person. "
+            "Also try to reflect user's emotions (not the direct anecdotes but the emotions) from their recent diary entries. Here are some of them\n"
+            f"{diary_snips}"
+        )
 
-    else:
-        pil_img = None
+        # 3) Build the letter prompt
+        letter_prompt = (
+            f"You are a friendly app character on a picture diary app. "
+            f"Here are some of user's recent diary entries and user's drawngs:\n"
+            f"{diary_snips}\n\n"
+            "Write a short letter (2–3 sentences) praising their work and "
+            "encouraging them to keep up caring themselves emotionally. You should focus on user's emotions from their diary entries.\n"
+            "Try to avoid direct mentions about user's drawings and content of diaries. Instead focus on their feelings and emotions.\n"
+            "And always maintain friendly and soothing vibe, try to write your letter as if you're one of user's close friends."
+        )
 
-    if pil_img:
-        # 메모리 버퍼에 PNG로 저장
-        buf = BytesIO()
-        pil_img.save(buf, format="PNG")
-        img_bytes = buf.getvalue()
-    else:
-        # Fallback: 임시 파일에 저장 후 읽기
-        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
-            try:
-                # reward_img.save(path) 만 지원하는 객체라면 이 분기로 옴
-                reward_img.save(tmp.name)
-                tmp.flush()
-                with open(tmp.name, "rb") as f:
-                    img_bytes = f.read()
-            finally:
-                os.unlink(tmp.name)
+    # 4) Generate the painting and the letter concurrently.
+    #    If one side fails, the other is cancelled instead of running on.
+    image_task  = asyncio.ensure_future(
+        _generate_image(img_model_name, image_prompt, retry_attempts, image_format, quality)
+    )
+    letter_task = asyncio.ensure_future(_generate_letter(letter_prompt, user_images))
+    try:
+        (img_bytes, mime_type), letter = await asyncio.gather(image_task, letter_task)
+    except BaseException:
+        image_task.cancel()
+        letter_task.cancel()
+        raise
+
+    # 5) Return both pieces (base64 is left to JSON responses, see to_base64)
+    return SimpleNamespace(image=img_bytes, mime_type=mime_type, letter=letter)
 
+
+def to_base64(data: bytes) -> str:
     # 최종 Base64 인코딩 결과
-    reward_b64 = base64.b64encode(img_bytes).decode("utf-8")
-
-    # 5) Prepare parts for letter generation
-    letter_prompt = (
-        f"You are a friendly app character on a picture diary app. "
-        f"Here are some of user's recent diary entries and user's drawngs:\n"
-        f"{diary_snips}\n\n"
-        "Write a short letter (2–3 sentences) praising their work and "
-        "encouraging them to keep up caring themselves emotionally. You should focus on user's emotions from their diary entries.\n"
-        "Try to avoid direct mentions about user's drawings and content of diaries. Instead focus on their feelings and emotions.\n"
-        "And always maintain friendly and soothing vibe, try to write your letter as if you're one of user's close friends."
-    )
-    parts = [Part.from_text(letter_prompt)]
+    with span("base64_encode"):
+        return base64.b64encode(data).decode("ascii")
 
-    # 6) Decode user-uploaded images (for context) and append
-    for img_str in user_images:
-        try:
-            if img_str.startswith("http://") or img_str.startswith("https://"):
-                # URL 인 경우 HTTP GET
-                resp = requests.get(img_str, timeout=5)
-                resp.raise_for_status()
-                img_bytes = resp.content
-            else:
-                # Base64 인 경우 디코딩
-                img_bytes = base64.b64decode(img_str)
-        except Exception as e:
-            raise RuntimeError(f"사용자 이미지 처리 중 오류: {e}")
-
-        # MIME type 추론(필요시). 여기서는 PNG 고정
-        parts.append(Part.from_data(data=img_bytes, mime_type="image/png"))
-
-    # 7) Call Gemini to generate the letter
-    resp = TEXT_MODEL.generate_content(
-        parts,
-        generation_config=GEN_TEXT_CFG,
-        safety_settings=SAFETY,
-        stream=False
-    )
-    letter = getattr(resp, "text", None) or resp.candidates[0].content.text
 
-    # 8) Return both pieces
-    return SimpleNamespace(image_b64=reward_b64, letter=letter)
+# ─── ASYNC JOB MODE ────────────────────────────────────────────────────────────
+# Hosts reward job callbacks may be sent to (comma separated; "*.example.com"
+# matches subdomains). Empty disables callbacks, so clients can't make the
+# server POST to internal or metadata addresses.
+CALLBACK_HOSTS = [h.strip().lower() for h in os.getenv("REWARD_CALLBACK_HOSTS", "").split(",") if h.strip()]
+
+
+def check_callback_url(url: str) -> None:
+    """
+    Raises ValueError unless `url` is an https URL on a REWARD_CALLBACK_HOSTS host.
+    Private, loopback and link-local IP addresses are refused even if listed.
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme != "https" or not host or parts.username or parts.password:
+        raise ValueError("callback_url must be a plain https URL")
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        address = None
+    if address is not None and not address.is_global:
+        raise ValueError(f"callback_url host {host!r} is not a public address")
+    if not any(host == h or (h.startswith("*.") and host.endswith(h[1:])) for h in CALLBACK_HOSTS):
+        raise ValueError(f"callback_url host {host!r} is not allowed")
+
+
+async def _post_callback(job) -> None:
+    if not job.callback_url:
+        return
+    check_callback_url(job.callback_url)
+    payload = {"job_id": job.id, "status": job.status, "error": job.error}
+    if job.result is not None:
+        payload.update(image=to_base64(job.result.image), mime_type=job.result.mime_type, letter=job.result.letter)
+    # No redirects: they could lead anywhere the allowlist doesn't
+    resp = await run_blocking(http_session.post, job.callback_url, json=payload, timeout=10, allow_redirects=False)
+    resp.raise_for_status()
+
+
+# Long Imagen runs are taken off the request path: jobs are queued and served
+# by a fixed number of workers; a full queue rejects new jobs (backpressure).
+reward_jobs = JobQueue(
+    "reward",
+    generate_reward,
+    workers=int(os.getenv("REWARD_JOB_WORKERS", "4")),
+    max_queue=int(os.getenv("REWARD_JOB_MAX_QUEUE", "100")),
+    result_ttl=float(os.getenv("REWARD_JOB_RESULT_TTL", "600")),
+    on_done=_post_callback,
+    deadline=float(os.getenv("REWARD_JOB_DEADLINE", "300")),
+)
+register_stats("reward_jobs", reward_jobs.stats)
+
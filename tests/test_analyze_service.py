@@ -0,0 +1,193 @@
+import asyncio
+
+import pytest
+
+import services.analyze_service as analyze_service
+from utils.result_cache import ResultCache
+from utils.singleflight import SingleFlight
+
+
+@pytest.fixture
+def model(monkeypatch):
+    """
+    Replaces the Gemini calls with scripted answers: set `model.replies[name]`
+    to a list of outputs; every call is recorded in `model.calls`.
+    """
+    class Model:
+        replies = {}
+        calls = []
+
+    async def generate_text(model_name, parts, config):
+        Model.calls.append(model_name)
+        return Model.replies[model_name].pop(0)
+
+    async def no_model(key):
+        return None
+
+    async def passthrough(image_bytes):
+        return image_bytes, "image/png"
+
+    async def no_context(subject):
+        return ""
+
+    monkeypatch.setattr(analyze_service, "_generate_text", generate_text)
+    monkeypatch.setattr(analyze_service, "get_model_async", no_model)
+    monkeypatch.setattr(analyze_service, "normalize_image_async", passthrough)
+    monkeypatch.setattr(analyze_service, "retrieve_context", no_context)
+    monkeypatch.setattr(analyze_service, "_result_cache", ResultCache(maxsize=16))
+    monkeypatch.setattr(analyze_service, "_inflight", SingleFlight())
+    monkeypatch.setattr(analyze_service, "ANALYZE_MODE", "generate")
+    monkeypatch.setattr(analyze_service, "CASCADE_MODEL_NAME", "")
+    return Model
+
+
+def analyze(image=b"drawing", subject="house"):
+    async def main():
+        return await analyze_service.analyze_image(image, subject)
+    result = asyncio.run(main())
+    return result.emotion, result.severity
+
+
+def test_parsed_result_is_cached(model):
+    model.replies[analyze_service.MODEL_NAME] = ['["depressed", "emergency"]']
+    assert analyze() == ("GLOOMY", "EMERGENCY")
+    assert analyze() == ("GLOOMY", "EMERGENCY")
+    assert model.calls == [analyze_service.MODEL_NAME]
+
+
+def test_unparseable_output_is_not_cached(model):
+    model.replies[analyze_service.MODEL_NAME] = [
+        "I'm not able to assess this drawing.",
+        '["anxious", "emergency"]',
+    ]
+    # The default stands in for the missing answer, but the retry asks again
+    assert analyze() == ("HAPPY", "SAFE")
+    assert analyze_service._result_cache.stats()["memory_size"] == 0
+    assert analyze() == ("ANXIOUS", "EMERGENCY")
+    assert len(model.calls) == 2
+
+
+def test_extract_reports_whether_it_parsed():
+    assert analyze_service.extract_emotion_severity('["angry","safe"]') == ("ANGRY", "SAFE", True)
+    assert analyze_service.extract_emotion_severity("feels anxious, emergency") == ("ANXIOUS", "EMERGENCY", True)
+    assert analyze_service.extract_emotion_severity("no idea") == ("HAPPY", "SAFE", False)
+
+
+def test_key_covers_model_and_prompt_version(monkeypatch):
+    key = analyze_service.analysis_key(b"img", "house", None)
+    assert key == analyze_service.analysis_key(b"img", "house", None)
+    assert key != analyze_service.analysis_key(b"img", "house", "text")
+    monkeypatch.setattr(analyze_service, "PROMPT_VERSION", "other")
+    assert key != analyze_service.analysis_key(b"img", "house", None)
+    monkeypatch.undo()
+    monkeypatch.setattr(analyze_service, "MODEL_NAME", "other-model")
+    assert key != analyze_service.analysis_key(b"img", "house", None)
+
+
+def test_concurrent_identical_requests_share_one_model_call(model):
+    model.replies[analyze_service.MODEL_NAME] = ['["angry", "safe"]', '["anxious", "safe"]']
+    slow = analyze_service._generate_text
+
+    async def generate_text(model_name, parts, config):
+        await asyncio.sleep(0.05)
+        return await slow(model_name, parts, config)
+
+    analyze_service._generate_text = generate_text
+
+    async def main():
+        return await asyncio.gather(
+            analyze_service.analyze_image(b"same", "house"),
+            analyze_service.analyze_image(b"same", "house"),
+            analyze_service.analyze_image(b"other", "house"),
+        )
+
+    same, twin, other = asyncio.run(main())
+    assert same.emotion == twin.emotion
+    assert {same.emotion, other.emotion} == {"ANGRY", "ANXIOUS"}
+    assert len(model.calls) == 2
+    assert analyze_service._inflight.stats()["followers"] == 1
+
+
+def classify(model, first, cascade=None, cascade_model=""):
+    analyze_service.CASCADE_MODEL_NAME = cascade_model
+    model.replies[analyze_service.MODEL_NAME] = [first]
+    if cascade is not None:
+        model.replies[cascade_model] = [cascade]
+    return asyncio.run(analyze_service.classify(["prompt"]))
+
+
+def answer(emotion, severity):
+    return '{"emotion": "%s", "severity": "%s"}' % (emotion, severity)
+
+
+def test_classify_safe_answer_is_not_escalated(model):
+    result = classify(model, answer("angry", "safe"), cascade_model="strong")
+    assert result == ("ANGRY", "SAFE", True)
+    assert model.calls == [analyze_service.MODEL_NAME]
+
+
+def test_classify_without_cascade_keeps_first_answer(model):
+    assert classify(model, answer("depressed", "emergency")) == ("GLOOMY", "EMERGENCY", True)
+    assert classify(model, "[\"anxious\", \"safe\"] probably") == ("ANXIOUS", "SAFE", True)
+    assert classify(model, "no answer") == ("HAPPY", "SAFE", False)
+
+
+@pytest.mark.parametrize("cascade", [
+    answer("depressed", "safe"),  # the cascade disagrees
+    "I can't tell.",              # the cascade doesn't parse
+])
+def test_cascade_never_downgrades_an_emergency(model, cascade):
+    emotion, severity, parsed = classify(model, answer("anxious", "emergency"), cascade, "strong")
+    assert severity == "EMERGENCY" and parsed
+    assert model.calls == [analyze_service.MODEL_NAME, "strong"]
+
+
+def test_cascade_settles_the_emotion(model):
+    result = classify(model, answer("anxious", "emergency"), answer("depressed", "emergency"), "strong")
+    assert result == ("GLOOMY", "EMERGENCY", True)
+
+
+def test_cascade_emergency_counts_when_first_answer_is_unparseable(model):
+    assert classify(model, "hmm", answer("angry", "emergency"), "strong") == ("ANGRY", "EMERGENCY", True)
+
+
+def test_cascade_text_emergency_counts_when_nothing_parses_strictly(model):
+    assert classify(model, "{}", "looks depressed, emergency", "strong") == ("GLOOMY", "EMERGENCY", True)
+
+
+def test_unparseable_everywhere_reports_not_parsed(model):
+    assert classify(model, "{}", "no idea", "strong") == ("HAPPY", "SAFE", False)
+
+
+def test_batch_reports_failed_items_and_finishes_the_rest(model, monkeypatch):
+    running, peak = [0], [0]
+
+    async def generate_text(model_name, parts, config):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        try:
+            await asyncio.sleep(0.01)
+            if "draw broken" in parts[0]:
+                raise RuntimeError("model refused")
+            return '["angry", "safe"]'
+        finally:
+            running[0] -= 1
+
+    monkeypatch.setattr(analyze_service, "_generate_text", generate_text)
+    items = [
+        (b"one", "house", None),
+        ("not base64!", "tree", None),
+        (b"two", "broken", None),
+        (b"three", "person", None),
+        (b"four", "sun", None),
+    ]
+
+    async def main():
+        return [r async for r in analyze_service.analyze_batch(items, concurrency=2)]
+
+    results = dict(asyncio.run(main()))
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    assert isinstance(results[1], ValueError)
+    assert isinstance(results[2], RuntimeError) and str(results[2]) == "model refused"
+    assert all(results[i].emotion == "ANGRY" for i in (0, 3, 4))
+    assert peak[0] <= 2
@@ -0,0 +1,30 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import routers.chatbot as chatbot
+from utils.ratelimit import RateLimited
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(chatbot.router, prefix="/ai")
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("path", ["/ai/chat", "/ai/chat/stream"])
+@pytest.mark.parametrize("headers", [{}, {"Authorization": "Basic abc"}])
+def test_missing_token_is_401_on_both_endpoints(client, path, headers):
+    resp = client.post(path, json={"message": "hi"}, headers=headers)
+    assert resp.status_code == 401
+    assert resp.json()["detail"] == "Authorization header missing or invalid"
+
+
+def test_model_errors_keep_their_status(client, monkeypatch):
+    async def busy(message, token):
+        raise RateLimited("gemini-2.0-flash")
+
+    monkeypatch.setattr(chatbot, "chat_with_history", busy)
+    resp = client.post("/ai/chat", json={"message": "hi"}, headers={"Authorization": "Bearer t"})
+    assert resp.status_code == 503
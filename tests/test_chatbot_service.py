@@ -0,0 +1,42 @@
+from services.chatbot_service import _known_prefix
+
+
+def turns(*ids):
+    return [("user" if i % 2 == 0 else "model", f"turn {i}") for i in ids]
+
+
+def test_new_session_knows_nothing():
+    assert _known_prefix([], turns(0, 1)) == 0
+
+
+def test_backend_appended_new_turns():
+    fetched = turns(0, 1, 2, 3)
+    n = _known_prefix(turns(0, 1), fetched)
+    assert n == 2 and fetched[n:] == turns(2, 3)
+
+
+def test_sliding_window_dropped_oldest_turns():
+    # The backend only returns the newest turns; the session still holds older ones
+    fetched = turns(2, 3, 4, 5, 6, 7)
+    n = _known_prefix(turns(0, 1, 2, 3, 4, 5), fetched)
+    assert n == 4 and fetched[n:] == turns(6, 7)
+
+
+def test_backend_lagging_behind_the_session():
+    # The last exchange went through this session but isn't in the backend yet
+    fetched = turns(0, 1, 2, 3)
+    n = _known_prefix(turns(0, 1, 2, 3, 4, 5), fetched)
+    assert n == 4 and fetched[n:] == []
+
+
+def test_sliding_and_lagging_at_once():
+    n = _known_prefix(turns(0, 1, 2, 3, 4, 5), turns(2, 3))
+    assert n == 2
+
+
+def test_diverged_history_forces_rebuild():
+    assert _known_prefix(turns(0, 1), [("user", "something else")]) is None
+
+
+def test_empty_backend_history_forces_rebuild():
+    assert _known_prefix(turns(0, 1), []) is None
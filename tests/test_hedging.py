@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+import utils.hedging as hedging
+from utils.hedging import Hedger
+
+
+def make_hedger(latencies=(0.01,) * 20, credits=1.0) -> Hedger:
+    h = Hedger("test")
+    h.enabled = True
+    h._latencies.extend(latencies)
+    h._credits = credits
+    return h
+
+
+class Call:
+    """A fake model call with a scripted delay / error per attempt."""
+
+    def __init__(self, *attempts):
+        self.attempts = list(attempts)
+        self.started = 0
+        self.cancelled = []
+
+    async def __call__(self):
+        n = self.started
+        self.started += 1
+        delay, error = self.attempts[n]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(n)
+            raise
+        if error:
+            raise error
+        return n
+
+
+def test_fast_call_is_not_hedged():
+    call = Call((0.001, None))
+    assert asyncio.run(make_hedger().run(call)) == 0
+    assert call.started == 1
+
+
+def test_hedge_wins_and_slow_call_is_cancelled():
+    call = Call((1.0, None), (0.001, None))
+    assert asyncio.run(make_hedger().run(call)) == 1
+    assert call.cancelled == [0]
+
+
+def test_separate_hedge_callable():
+    call, hedge = Call((1.0, None)), Call((0.001, None))
+    assert asyncio.run(make_hedger().run(call, hedge)) == 0
+    assert hedge.started == 1 and call.cancelled == [0]
+
+
+def test_failed_primary_falls_back_to_hedge():
+    call = Call((0.1, ValueError("primary")), (0.2, None))
+    assert asyncio.run(make_hedger().run(call)) == 1
+
+
+def test_both_failing_raises_primary_error():
+    call = Call((0.1, ValueError("primary")), (0.06, KeyError("hedge")))
+    with pytest.raises(ValueError, match="primary"):
+        asyncio.run(make_hedger().run(call))
+
+
+def test_no_hedge_without_budget():
+    call = Call((0.1, None), (0.001, None))
+    assert asyncio.run(make_hedger(credits=0.0).run(call)) == 0
+    assert call.started == 1
+
+
+def test_no_hedge_before_enough_samples():
+    call = Call((0.1, None), (0.001, None))
+    assert asyncio.run(make_hedger(latencies=()).run(call)) == 0
+    assert call.started == 1
+
+
+def test_caller_cancellation_cancels_both_calls():
+    call = Call((1.0, None), (1.0, None))
+
+    async def main():
+        task = asyncio.ensure_future(make_hedger().run(call))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert sorted(call.cancelled) == [0, 1]
+
+
+def test_delay_is_capped_by_median_when_outliers_dominate_the_percentile():
+    # 10% outliers: p95 is an outlier latency, the cap keeps the delay near the median
+    h = make_hedger(latencies=[0.02] * 18 + [0.5] * 2)
+    assert h.delay() == pytest.approx(0.02 * hedging.HEDGE_MAX_FACTOR)
+
+
+def test_delay_uses_percentile_below_the_cap():
+    h = make_hedger(latencies=[0.1] * 19 + [0.2])
+    assert h.delay() == pytest.approx(0.1)
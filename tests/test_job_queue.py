@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from utils.job_queue import JobQueue, QueueFull
+
+
+def test_queued_and_running_jobs_outlive_the_result_ttl():
+    async def main():
+        async def handler(x):
+            await asyncio.sleep(0.6)
+            return x
+
+        queue = JobQueue("test", handler, workers=1, result_ttl=0.2)
+        running, queued = queue.submit(1), queue.submit(2)
+        await asyncio.sleep(0.3)
+        seen = [job and job.status for job in (queue.get(running.id), queue.get(queued.id))]
+        await queue.shutdown(timeout=3)
+        return running, queued, seen
+
+    running, queued, seen = asyncio.run(main())
+    assert seen == ["running", "queued"]
+    assert (running.result, queued.result) == (1, 2)
+
+
+def test_finished_jobs_expire_after_the_result_ttl():
+    async def main():
+        async def handler():
+            return "ok"
+
+        queue = JobQueue("test", handler, workers=1, result_ttl=0.1)
+        job = queue.submit()
+        await queue.shutdown(timeout=1)
+        done = queue.get(job.id)
+        await asyncio.sleep(0.15)
+        return done, queue.get(job.id)
+
+    done, expired = asyncio.run(main())
+    assert done.status == "done" and done.result == "ok"
+    assert expired is None
+
+
+def test_full_queue_rejects_new_jobs():
+    async def main():
+        release = asyncio.Event()
+
+        async def handler():
+            await release.wait()
+
+        queue = JobQueue("test", handler, workers=1, max_queue=1)
+        queue.submit()
+        await asyncio.sleep(0)  # the worker takes the first job
+        queue.submit()
+        with pytest.raises(QueueFull):
+            queue.submit()
+        release.set()
+        await queue.shutdown(timeout=1)
+        return queue.stats()
+
+    stats = asyncio.run(main())
+    assert (stats["submitted"], stats["rejected"], stats["succeeded"]) == (2, 1, 2)
+
+
+def test_failed_job_reports_error_and_runs_on_done():
+    async def main():
+        finished = []
+
+        async def handler():
+            raise RuntimeError("imagen down")
+
+        async def on_done(job):
+            finished.append(job.status)
+
+        queue = JobQueue("test", handler, workers=1, on_done=on_done)
+        job = queue.submit()
+        await queue.shutdown(timeout=1)
+        await asyncio.sleep(0)
+        return job, finished
+
+    job, finished = asyncio.run(main())
+    assert (job.status, job.error) == ("failed", "imagen down")
+    assert finished == ["failed"]
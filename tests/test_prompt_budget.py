@@ -0,0 +1,61 @@
+import asyncio
+
+from utils.prompt_budget import RollingSummarizer, count_tokens, fit_entries, newest_within, truncate_to_tokens
+
+
+def test_count_tokens_rounds_up_utf8_bytes():
+    assert count_tokens("") == 0
+    assert count_tokens("abcd") == 1
+    assert count_tokens("abcde") == 2
+    assert count_tokens("안녕") == 2  # 6 bytes
+
+
+def test_newest_within_keeps_the_longest_fitting_suffix():
+    items = ["a" * 8, "b" * 8, "c" * 8]  # 2 tokens each
+    assert newest_within(items, 6) == 0
+    assert newest_within(items, 5) == 1
+    assert newest_within(items, 1) == 3
+    assert newest_within([], 10) == 0
+
+
+def test_truncate_leaves_short_text_alone():
+    assert truncate_to_tokens("short", 10) == "short"
+
+
+def test_truncate_never_splits_a_character():
+    text = "가" * 10  # 3 bytes each
+    out = truncate_to_tokens(text, 2)  # 8 bytes: two whole syllables
+    assert out == "가가…"
+
+
+def test_fit_entries_drops_older_entries_without_summarizer():
+    entries = ["old " * 10, "new"]
+    assert asyncio.run(fit_entries(entries, 2, None)) == ("", ["new"])
+
+
+def test_fit_entries_folds_older_entries_into_a_summary():
+    prompts = []
+
+    async def generate(prompt):
+        prompts.append(prompt)
+        return "summary of old"
+
+    summarizer = RollingSummarizer("test", generate, max_tokens=16)
+    entries = ["old " * 10, "new"]
+    summary, kept = asyncio.run(fit_entries(entries, 2, summarizer))
+    assert (summary, kept) == ("summary of old", ["new"])
+    # The same items fold from the cache
+    asyncio.run(fit_entries(entries, 2, summarizer))
+    assert len(prompts) == 1
+
+
+def test_failed_summary_keeps_items_verbatim_within_budget():
+    async def generate(prompt):
+        raise RuntimeError("quota")
+
+    summarizer = RollingSummarizer("test", generate, max_tokens=4)
+    folded = asyncio.run(summarizer.fold("earlier", ["x" * 40]))
+    assert folded.startswith("earlier\nxxxx") and folded.endswith("…")
+    assert count_tokens(folded) <= 5
+    # Failures are not cached
+    assert summarizer.stats()["size"] == 0
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from utils.ratelimit import RateLimited, TokenBucket
+
+
+def test_burst_is_served_without_waiting():
+    async def main():
+        bucket = TokenBucket(rate=1.0, burst=3)
+        return [await bucket.acquire() for _ in range(3)]
+
+    assert asyncio.run(main()) == [0.0, 0.0, 0.0]
+
+
+def test_callers_queue_behind_each_other():
+    async def main():
+        bucket = TokenBucket(rate=100.0, burst=1)
+        await bucket.acquire()
+        return await asyncio.gather(bucket.acquire(), bucket.acquire())
+
+    first, second = asyncio.run(main())
+    assert first == pytest.approx(0.01, abs=0.005)
+    assert second == pytest.approx(0.02, abs=0.005)
+
+
+def test_wait_past_timeout_gives_the_token_back():
+    async def main():
+        bucket = TokenBucket(rate=1.0, burst=1)
+        await bucket.acquire()
+        tokens = bucket.stats()["tokens"]
+        with pytest.raises(RateLimited):
+            await bucket.acquire(timeout=0.1)
+        # The failed reservation must not push later callers further back
+        return tokens, bucket.stats()["tokens"]
+
+    before, after = asyncio.run(main())
+    assert after == pytest.approx(before, abs=0.05)
+
+
+def test_pause_holds_back_even_an_unpaced_bucket():
+    async def main():
+        bucket = TokenBucket(rate=0, burst=1)
+        assert await bucket.acquire() == 0.0
+        bucket.pause(0.05)
+        with pytest.raises(RateLimited):
+            await bucket.acquire(timeout=0.01)
+        return await bucket.acquire()
+
+    assert asyncio.run(main()) == pytest.approx(0.05, abs=0.01)
+
+
+def test_pause_drains_stored_tokens():
+    bucket = TokenBucket(rate=10.0, burst=5)
+    bucket.pause(0.0)
+    assert bucket.stats()["tokens"] <= 0.01
@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+from utils.result_cache import ResultCache
+
+
+def test_memory_tier_hit():
+    async def main():
+        cache = ResultCache(maxsize=4)
+        assert await cache.aget("k") is None
+        await cache.aset("k", {"emotion": "HAPPY"})
+        return cache, await cache.aget("k")
+
+    cache, value = asyncio.run(main())
+    assert value == {"emotion": "HAPPY"}
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 0, 1)
+    assert stats["disk_enabled"] is False
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    db = str(tmp_path / "results.db")
+
+    async def main():
+        await ResultCache(db_path=db).aset("k", {"severity": "EMERGENCY"})
+        # A new instance starts with an empty memory tier
+        restarted = ResultCache(db_path=db)
+        first = await restarted.aget("k")
+        second = await restarted.aget("k")
+        return restarted, first, second
+
+    restarted, first, second = asyncio.run(main())
+    assert first == second == {"severity": "EMERGENCY"}
+    stats = restarted.stats()
+    assert (stats["disk_hits"], stats["memory_hits"]) == (1, 1)
+
+
+def test_expired_rows_are_not_served(tmp_path):
+    db = str(tmp_path / "results.db")
+
+    async def main():
+        await ResultCache(ttl=0.05, db_path=db).aset("k", {"emotion": "HAPPY"})
+        await asyncio.sleep(0.1)
+        return await ResultCache(ttl=0.05, db_path=db).aget("k")
+
+    assert asyncio.run(main()) is None
+
+
+def test_trim_keeps_most_recently_used_rows(tmp_path):
+    cache = ResultCache(maxsize=1, db_path=str(tmp_path / "results.db"), max_rows=2)
+    for key in ("a", "b", "c"):
+        cache._disk_set(key, {"key": key})
+        time.sleep(0.01)
+    cache._disk_get("a")
+    with cache._db_lock:
+        cache._trim(cache._connection(), time.time())
+    assert cache._disk_get("b") is None
+    assert cache._disk_get("a") == {"key": "a"}
+    assert cache._disk_get("c") == {"key": "c"}
@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import services.reward_service as reward_service
+from services.reward_service import check_callback_url
+
+
+@pytest.fixture(autouse=True)
+def allowlist(monkeypatch):
+    monkeypatch.setattr(reward_service, "CALLBACK_HOSTS", ["hooks.example.com", "*.dearmind.app", "10.0.0.5"])
+
+
+@pytest.mark.parametrize("url", [
+    "https://hooks.example.com/reward",
+    "https://HOOKS.example.com:8443/reward?x=1",
+    "https://api.dearmind.app/jobs",
+])
+def test_allowed_callback_urls(url):
+    check_callback_url(url)
+
+
+@pytest.mark.parametrize("url", [
+    "http://hooks.example.com/reward",             # not https
+    "https://user:pw@hooks.example.com/reward",    # credentials
+    "https://hooks.example.com.evil.net/reward",   # suffix trick
+    "https://evildearmind.app/",                   # not a subdomain
+    "https://dearmind.app.evil.net/",
+    "https://127.0.0.1/",                          # loopback
+    "https://169.254.169.254/latest/meta-data",    # metadata service
+    "https://10.0.0.5/",                           # private, even when listed
+    "https://[::1]/",
+    "file:///etc/passwd",
+    "not a url",
+])
+def test_rejected_callback_urls(url):
+    with pytest.raises(ValueError):
+        check_callback_url(url)
+
+
+def test_callback_is_posted_without_following_redirects(monkeypatch):
+    posts = []
+
+    class Session:
+        def post(self, url, **kwargs):
+            posts.append((url, kwargs))
+            return SimpleNamespace(raise_for_status=lambda: None)
+
+    monkeypatch.setattr(reward_service, "http_session", Session())
+    job = SimpleNamespace(id="j1", status="failed", error="boom", result=None,
+                          callback_url="https://hooks.example.com/reward")
+    asyncio.run(reward_service._post_callback(job))
+    (url, kwargs), = posts
+    assert url == job.callback_url
+    assert kwargs["allow_redirects"] is False
+    assert kwargs["json"] == {"job_id": "j1", "status": "failed", "error": "boom"}
+
+
+def test_callback_url_is_checked_again_before_posting(monkeypatch):
+    monkeypatch.setattr(reward_service, "CALLBACK_HOSTS", [])
+    job = SimpleNamespace(id="j1", status="done", error=None, result=None,
+                          callback_url="https://hooks.example.com/reward")
+    with pytest.raises(ValueError):
+        asyncio.run(reward_service._post_callback(job))
+
+
+def test_concurrent_identical_rewards_share_one_generation(monkeypatch):
+    calls = []
+
+    async def generate(user_images, art_style, *args):
+        calls.append((tuple(user_images), art_style))
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(image=b"png", mime_type="image/png", letter=art_style)
+
+    monkeypatch.setattr(reward_service, "_generate_reward", generate)
+    monkeypatch.setattr(reward_service, "_inflight", reward_service.SingleFlight())
+
+    async def main():
+        return await asyncio.gather(
+            reward_service.generate_reward([b"img"], "watercolor"),
+            reward_service.generate_reward([b"img"], "watercolor"),
+            reward_service.generate_reward([b"img"], "crayon"),
+        )
+
+    first, twin, other = asyncio.run(main())
+    assert first is twin
+    assert other.letter == "crayon"
+    assert sorted(calls) == [((b"img",), "crayon"), ((b"img",), "watercolor")]
+
+
+def test_reward_key_covers_every_input():
+    base = reward_service.reward_key([b"img"], "watercolor", ["diary"], 3)
+    assert base == reward_service.reward_key([b"img"], "watercolor", ["diary"], 3)
+    assert base != reward_service.reward_key([b"img2"], "watercolor", ["diary"], 3)
+    assert base != reward_service.reward_key([b"img"], "crayon", ["diary"], 3)
+    assert base != reward_service.reward_key([b"img"], "watercolor", ["other"], 3)
+    assert base != reward_service.reward_key([b"img"], "watercolor", ["diary"], 3, "webp")
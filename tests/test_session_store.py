@@ -0,0 +1,49 @@
+import time
+
+from utils.session_store import SessionStore
+
+
+def test_least_recently_used_is_evicted_first():
+    store = SessionStore(max_sessions=2)
+    store.put("a", 1)
+    store.put("b", 2)
+    assert store.get("a") == 1  # "b" is now the oldest
+    store.put("c", 3)
+    assert store.get("b") is None
+    assert store.get("a") == 1 and store.get("c") == 3
+    assert store.evictions == 1
+
+
+def test_byte_cap_evicts_until_under_budget():
+    store = SessionStore(max_bytes=100)
+    store.put("a", "A", size=40)
+    store.put("b", "B", size=40)
+    store.put("c", "C", size=40)
+    assert store.get("a") is None
+    assert store.stats()["bytes"] == 80
+
+
+def test_resize_on_put_updates_byte_total():
+    store = SessionStore(max_bytes=100)
+    store.put("a", "A", size=40)
+    store.put("b", "B", size=40)
+    store.put("a", "A", size=70)  # "a" grew; "b" is now the oldest and goes
+    assert store.get("b") is None
+    assert store.stats()["bytes"] == 70
+
+
+def test_discard_releases_bytes():
+    store = SessionStore(max_bytes=100)
+    store.put("a", "A", size=60)
+    store.discard("a")
+    store.put("b", "B", size=60)
+    assert store.get("b") == "B"
+    assert store.stats()["bytes"] == 60
+
+
+def test_idle_entries_expire():
+    store = SessionStore(idle_ttl=0.02)
+    store.put("a", 1)
+    time.sleep(0.03)
+    assert store.get("a") is None
+    assert len(store) == 0
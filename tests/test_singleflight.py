@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from utils.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    async def main():
+        sf, calls = SingleFlight(), []
+
+        async def fn(x):
+            calls.append(x)
+            await asyncio.sleep(0.01)
+            return x * 2
+
+        results = await asyncio.gather(*(sf.do("k", fn, 21) for _ in range(5)))
+        return sf, calls, results
+
+    sf, calls, results = asyncio.run(main())
+    assert results == [42] * 5
+    assert calls == [21]
+    assert sf.stats() == {"in_flight": 0, "leaders": 1, "followers": 4, "abandoned": 0}
+
+
+def test_error_fans_out_to_every_waiter():
+    async def main():
+        sf = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        return await asyncio.gather(*(sf.do("k", fn) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) and str(r) == "boom" for r in results)
+
+
+def test_leader_cancel_keeps_call_running_for_followers():
+    async def main():
+        sf, started = SingleFlight(), []
+
+        async def fn():
+            started.append(1)
+            await asyncio.sleep(0.05)
+            return "done"
+
+        leader = asyncio.ensure_future(sf.do("k", fn))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(sf.do("k", fn))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return sf, started, await follower
+
+    sf, started, result = asyncio.run(main())
+    assert result == "done"
+    assert started == [1]
+    assert sf.abandoned == 0
+
+
+def test_call_is_cancelled_when_last_waiter_leaves():
+    async def main():
+        sf, cancelled = SingleFlight(), []
+
+        async def fn():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        waiters = [asyncio.ensure_future(sf.do("k", fn)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for w in waiters:
+            w.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        return sf, cancelled
+
+    sf, cancelled = asyncio.run(main())
+    assert cancelled == [1]
+    assert sf.abandoned == 1
+    assert sf.stats()["in_flight"] == 0
+
+
+def test_new_call_after_previous_finished():
+    async def main():
+        sf, calls = SingleFlight(), []
+
+        async def fn():
+            calls.append(1)
+            return len(calls)
+
+        return await sf.do("k", fn), await sf.do("k", fn)
+
+    assert asyncio.run(main()) == (1, 2)
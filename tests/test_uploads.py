@@ -0,0 +1,57 @@
+import pytest
+from fastapi import FastAPI, File, Request, UploadFile
+from fastapi.testclient import TestClient
+
+import utils.uploads as uploads
+
+app = FastAPI()
+
+
+@app.post("/raw")
+async def raw(request: Request):
+    return {"size": len(await uploads.read_raw_body(request))}
+
+
+@app.post("/multipart")
+async def multipart(image: UploadFile = File(...)):
+    return {"size": len(await uploads.read_upload(image))}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_BYTES", 1000)
+    monkeypatch.setattr(uploads, "SPOOL_MAX_MEMORY", 100)
+    return TestClient(app)
+
+
+def test_raw_image_body_is_read(client):
+    resp = client.post("/raw", content=b"x" * 1000, headers={"Content-Type": "image/png"})
+    assert resp.status_code == 200 and resp.json() == {"size": 1000}
+
+
+@pytest.mark.parametrize("content_type", ["application/json", "text/plain; charset=utf-8", ""])
+def test_raw_body_must_be_an_image(client, content_type):
+    resp = client.post("/raw", content=b"{}", headers={"Content-Type": content_type})
+    assert resp.status_code == 415
+
+
+def test_raw_content_type_parameters_are_ignored(client):
+    resp = client.post("/raw", content=b"x", headers={"Content-Type": "IMAGE/JPEG; q=1"})
+    assert resp.status_code == 200
+
+
+def test_raw_body_over_the_limit_is_rejected(client):
+    resp = client.post("/raw", content=b"x" * 1001, headers={"Content-Type": "image/png"})
+    assert resp.status_code == 413
+
+
+def test_empty_raw_body_is_rejected(client):
+    resp = client.post("/raw", content=b"", headers={"Content-Type": "image/png"})
+    assert resp.status_code == 400
+
+
+def test_multipart_upload_limit(client):
+    ok = client.post("/multipart", files={"image": ("a.png", b"x" * 1000, "image/png")})
+    too_large = client.post("/multipart", files={"image": ("a.png", b"x" * 1001, "image/png")})
+    assert ok.status_code == 200 and ok.json() == {"size": 1000}
+    assert too_large.status_code == 413
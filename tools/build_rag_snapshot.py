@@ -0,0 +1,133 @@
+# tools/build_rag_snapshot.py
+"""
+Builds the local RAG snapshot used with RETRIEVAL_BACKEND=local.
+
+The source documents of the Vertex RAG corpus are chunked, embedded with a
+Vertex text embedding model and written as a memory-mappable index
+(see utils/vector_index.py). Query embeddings for the drawing subjects are
+precomputed too, so retrieval for those needs no network call at all.
+
+    python -m tools.build_rag_snapshot --docs corpus_docs/ --out rag_index
+    python -m tools.build_rag_snapshot --chunks chunks.jsonl --subjects house,tree,person
+
+--docs takes a directory of .txt / .md files; --chunks a JSONL file with one
+{"text": ...} object per chunk (e.g. chunks exported from another pipeline).
+Chunking mirrors the corpus defaults (about 1024 tokens, 200 overlap).
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Iterable, List, Optional
+
+from utils.prompt_budget import count_tokens
+
+
+def chunk_text(text: str, chunk_tokens: int, overlap_tokens: int) -> List[str]:
+    """
+    Packs paragraphs into chunks of at most ~`chunk_tokens`, repeating about
+    `overlap_tokens` worth of trailing paragraphs at the start of the next chunk.
+    Paragraphs longer than a chunk are split on words.
+    """
+    paragraphs: List[str] = []
+    for para in (p.strip() for p in text.split("\n\n")):
+        if not para:
+            continue
+        if count_tokens(para) <= chunk_tokens:
+            paragraphs.append(para)
+            continue
+        words, piece = para.split(), []
+        for word in words:
+            if piece and count_tokens(" ".join(piece + [word])) > chunk_tokens:
+                paragraphs.append(" ".join(piece))
+                piece = []
+            piece.append(word)
+        if piece:
+            paragraphs.append(" ".join(piece))
+
+    chunks: List[str] = []
+    current: List[str] = []
+    for para in paragraphs:
+        if current and count_tokens("\n\n".join(current + [para])) > chunk_tokens:
+            chunks.append("\n\n".join(current))
+            overlap: List[str] = []
+            for prev in reversed(current):
+                if count_tokens("\n\n".join([prev] + overlap)) > overlap_tokens:
+                    break
+                overlap.insert(0, prev)
+            current = overlap
+        current.append(para)
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def read_docs(directory: str) -> Iterable[str]:
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith((".txt", ".md")):
+                with open(os.path.join(root, name), encoding="utf-8") as f:
+                    yield f.read()
+
+
+def read_chunks(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["text"] for line in f if line.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Build the local RAG vector snapshot")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("--docs", help="directory of .txt/.md source documents")
+    src.add_argument("--chunks", help="JSONL file of pre-chunked {\"text\": ...} records")
+    p.add_argument("--out", default=os.getenv("RAG_INDEX_PATH", "rag_index"))
+    p.add_argument("--model", default="text-embedding-005", help="Vertex text embedding model")
+    p.add_argument("--chunk-tokens", type=int, default=1024)
+    p.add_argument("--overlap-tokens", type=int, default=200)
+    p.add_argument("--subjects", default=os.getenv("RAG_WARM_SUBJECTS", ""),
+                   help="comma-separated drawing subjects whose query embeddings are precomputed")
+    args = p.parse_args(argv)
+
+    # Imported here so --help works without the service dependencies
+    from services.analyze_service import CORPUS_NAME, build_retrieval_prompt
+    from utils.models import embed_texts, vertex_embedding_model
+    from utils.vector_index import VectorIndex
+
+    if args.docs:
+        texts = [c for doc in read_docs(args.docs) for c in chunk_text(doc, args.chunk_tokens, args.overlap_tokens)]
+    else:
+        texts = read_chunks(args.chunks)
+    if not texts:
+        print("No chunks to index", file=sys.stderr)
+        return 1
+
+    model = vertex_embedding_model(args.model)()
+    start = time.perf_counter()
+    vectors = embed_texts(model, texts, "RETRIEVAL_DOCUMENT")
+    subjects = [s.strip() for s in args.subjects.split(",") if s.strip()]
+    queries = [build_retrieval_prompt(s) for s in subjects]
+    query_vectors = embed_texts(model, queries, "RETRIEVAL_QUERY") if queries else []
+
+    VectorIndex.write(
+        args.out,
+        meta={
+            "embedding_model": args.model,
+            "source_corpus": CORPUS_NAME,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "chunk_tokens": args.chunk_tokens,
+            "overlap_tokens": args.overlap_tokens,
+            "subjects": subjects,
+        },
+        texts=texts,
+        embeddings=vectors,
+        queries=dict(zip(queries, query_vectors)),
+    )
+    print(f"Wrote {len(texts)} chunks and {len(queries)} query embeddings to {args.out} "
+          f"in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 # utils/auth.py
 
+from typing import Optional
 from fastapi import Request, HTTPException
 
 def extract_bearer_token(request: Request) -> str:
@@ -12,3 +13,12 @@ def extract_bearer_token(request: Request) -> str:
         raise HTTPException(status_code=401, detail="Authorization header missing or invalid")
 
     return auth_header.split("Bearer ")[1].strip()
+
+def optional_bearer_token(request: Request) -> Optional[str]:
+    """
+    Same as extract_bearer_token, but returns None instead of raising.
+    """
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return None
+    return auth_header.split("Bearer ")[1].strip() or None
@@ -0,0 +1,157 @@
+# utils/concurrency.py
+
+import os
+import time
+import asyncio
+import contextvars
+import functools
+import inspect
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional
+
+from utils.metrics import MODEL_SECONDS, counter, register_stats, span
+from utils.ratelimit import limiter_stats, model_bucket, model_setting, throttle
+from utils.retry import (
+    MODEL_RETRY_ATTEMPTS,
+    DeadlineExceeded,
+    backoff_delay,
+    check_deadline,
+    error_code,
+    is_quota_error,
+    is_retryable,
+    remaining,
+)
+
+logger = logging.getLogger(__name__)
+
+# ─── CONFIG ────────────────────────────────────────────────────────────────────
+# Threads used for SDK calls that have no native async variant
+# (Imagen, RAG retrieval, backend HTTP fetches, PIL work).
+THREAD_POOL_SIZE = int(os.getenv("AI_THREAD_POOL_SIZE", "32"))
+
+# Default number of in-flight calls allowed per model. Override per model with
+# AI_MODEL_CONCURRENCY_<MODEL>, e.g. AI_MODEL_CONCURRENCY_GEMINI_2_0_FLASH=32.
+DEFAULT_MODEL_CONCURRENCY = int(os.getenv("AI_MODEL_CONCURRENCY", "16"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+MODEL_RETRIES = counter("dearmind_model_retries_total", "Retried model calls", ("model", "reason"))
+register_stats("model_limiter", limiter_stats)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Created on first use so importing this module never spawns threads.
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=THREAD_POOL_SIZE, thread_name_prefix="ai-worker"
+        )
+    return _executor
+
+
+def model_concurrency(model_name: str) -> int:
+    """
+    Returns the concurrency limit configured for `model_name`.
+    """
+    return int(model_setting("AI_MODEL_CONCURRENCY", model_name, DEFAULT_MODEL_CONCURRENCY))
+
+
+def _model_semaphore(model_name: str) -> asyncio.Semaphore:
+    sem = _semaphores.get(model_name)
+    if sem is None:
+        sem = asyncio.Semaphore(model_concurrency(model_name))
+        _semaphores[model_name] = sem
+    return sem
+
+
+# ─── PUBLIC API ────────────────────────────────────────────────────────────────
+async def run_blocking(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Runs a synchronous callable on the shared worker pool and awaits its result.
+    The caller's contextvars are carried over to the worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, fn, *args, **kwargs)
+    return await loop.run_in_executor(_get_executor(), call)
+
+
+@asynccontextmanager
+async def model_slot(model_name: str):
+    """
+    Holds one of the concurrency slots of `model_name` for the duration of the
+    block, once the model's rate limiter lets the call start. Gives up with
+    DeadlineExceeded / RateLimited rather than wait past the request deadline.
+    """
+    sem = _model_semaphore(model_name)
+    try:
+        await asyncio.wait_for(sem.acquire(), check_deadline())
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"Request deadline exceeded waiting for a {model_name} slot")
+    try:
+        await throttle(model_name, check_deadline())
+        yield
+    finally:
+        sem.release()
+
+
+async def _call_once(model_name: str, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+    async with model_slot(model_name):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            with span("model_call"):
+                if inspect.iscoroutinefunction(fn):
+                    call = fn(*args, **kwargs)
+                else:
+                    call = run_blocking(fn, *args, **kwargs)
+                try:
+                    result = await asyncio.wait_for(call, remaining())
+                except asyncio.TimeoutError:
+                    raise DeadlineExceeded(f"Request deadline exceeded during the {model_name} call")
+            outcome = "ok"
+            return result
+        finally:
+            MODEL_SECONDS.observe(time.perf_counter() - start, model=model_name, outcome=outcome)
+
+
+async def call_model(model_name: str, fn: Callable[..., Any], *args,
+                     max_attempts: Optional[int] = None, **kwargs) -> Any:
+    """
+    Calls a model SDK method under the per-model concurrency and rate limits.
+    Coroutine functions (native async SDK calls) are awaited directly,
+    anything else is pushed to the worker pool.
+    Retryable errors (see utils.retry) are retried up to `max_attempts` times
+    (default AI_RETRY_ATTEMPTS) with jittered exponential backoff, within the
+    current request deadline. A quota error also holds back the model's other
+    callers for the backoff period.
+    """
+    attempts = max_attempts or MODEL_RETRY_ATTEMPTS
+    for attempt in range(1, attempts + 1):
+        try:
+            return await _call_once(model_name, fn, args, kwargs)
+        except Exception as e:
+            if attempt == attempts or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt)
+            left = remaining()
+            if left is not None and delay >= left:
+                raise
+            MODEL_RETRIES.inc(model=model_name, reason=str(error_code(e) or type(e).__name__))
+            logger.warning("%s call failed (attempt %d/%d), retrying in %.2fs: %s",
+                           model_name, attempt, attempts, delay, e)
+            if is_quota_error(e):
+                # The limiter makes the retry (and everyone else) wait out the backoff
+                model_bucket(model_name).pause(delay)
+            else:
+                await asyncio.sleep(delay)
+
+
+def shutdown_executor(wait: bool = True) -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
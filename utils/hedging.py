@@ -0,0 +1,118 @@
+# utils/hedging.py
+
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+from utils.metrics import counter
+from utils.ratelimit import model_setting
+
+logger = logging.getLogger(__name__)
+
+# ─── CONFIG ────────────────────────────────────────────────────────────────────
+# Hedging is opt-in per route: AI_HEDGE_<ROUTE>=1 (or AI_HEDGE=1 for all).
+# A duplicate call is fired once the first one has run longer than the
+# AI_HEDGE_PERCENTILE-th percentile of the route's recent latencies, as long
+# as hedges stay under AI_HEDGE_BUDGET (a fraction of calls). Percentile and
+# budget can be overridden per route, e.g. AI_HEDGE_BUDGET_CHAT=0.1.
+# The delay is capped at AI_HEDGE_MAX_FACTOR times the median: when outliers
+# make up more than (100 - percentile)% of calls, the percentile itself is an
+# outlier latency and hedging would never fire.
+HEDGE_DEFAULT = float(os.getenv("AI_HEDGE", "0"))
+HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE", "95"))
+HEDGE_BUDGET = float(os.getenv("AI_HEDGE_BUDGET", "0.05"))
+HEDGE_MIN_DELAY = float(os.getenv("AI_HEDGE_MIN_DELAY", "0.05"))
+HEDGE_MIN_SAMPLES = int(os.getenv("AI_HEDGE_MIN_SAMPLES", "5"))
+HEDGE_WINDOW = int(os.getenv("AI_HEDGE_WINDOW", "500"))
+HEDGE_MAX_FACTOR = float(os.getenv("AI_HEDGE_MAX_FACTOR", "3"))
+# Unused budget carried over, in hedges; bounds a burst of hedges after a quiet spell
+HEDGE_MAX_CREDITS = 10.0
+
+HEDGES = counter("dearmind_hedges_total", "Hedged model calls", ("route", "result"))
+
+
+class Hedger:
+    """
+    Request hedging for one route. run() starts a call and, if it hasn't
+    finished after the route's latency percentile, a duplicate; whichever
+    succeeds first wins and the other is cancelled. Until HEDGE_MIN_SAMPLES
+    latencies are known, or when the budget is spent, calls are not hedged.
+    Counters: fired (duplicate started), won (duplicate finished first),
+    over_budget (would have hedged but the budget was spent).
+    """
+
+    def __init__(self, route: str):
+        self.route = route
+        self.enabled = model_setting("AI_HEDGE", route, HEDGE_DEFAULT) > 0
+        self.percentile = model_setting("AI_HEDGE_PERCENTILE", route, HEDGE_PERCENTILE)
+        self.budget = model_setting("AI_HEDGE_BUDGET", route, HEDGE_BUDGET)
+        self._latencies = deque(maxlen=HEDGE_WINDOW)
+        self._credits = 1.0
+        self.calls = 0
+
+    def delay(self) -> Optional[float]:
+        """
+        Seconds to wait before hedging, or None while there are too few samples.
+        """
+        if len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        i = min(len(ordered) - 1, max(0, math.ceil(self.percentile / 100 * len(ordered)) - 1))
+        median = ordered[len(ordered) // 2]
+        return max(HEDGE_MIN_DELAY, min(ordered[i], median * HEDGE_MAX_FACTOR))
+
+    async def run(self, call: Callable[[], Awaitable[Any]],
+                  hedge: Optional[Callable[[], Awaitable[Any]]] = None) -> Any:
+        """
+        Awaits `call()`, hedged with `hedge()` (default: `call()` again).
+        Both must be safe to run concurrently and to cancel.
+        """
+        if not self.enabled:
+            return await call()
+        self.calls += 1
+        self._credits = min(HEDGE_MAX_CREDITS, self._credits + self.budget)
+        delay = self.delay()
+        start = time.perf_counter()
+        primary = asyncio.ensure_future(call())
+        tasks = {primary}
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    if self._credits >= 1:
+                        self._credits -= 1
+                        HEDGES.inc(route=self.route, result="fired")
+                        tasks.add(asyncio.ensure_future((hedge or call)()))
+                    else:
+                        HEDGES.inc(route=self.route, result="over_budget")
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # exception() on every finished task, so a failed loser isn't reported as unretrieved
+                succeeded = [t for t in done if t.exception() is None]
+                if succeeded:
+                    winner = primary if primary in succeeded else succeeded[0]
+                    self._latencies.append(time.perf_counter() - start)
+                    if winner is not primary:
+                        HEDGES.inc(route=self.route, result="won")
+                    return winner.result()
+            # Every call failed: report the original one's error
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "calls": self.calls,
+            "delay": self.delay(),
+            "samples": len(self._latencies),
+            "credits": round(self._credits, 3),
+        }
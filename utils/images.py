@@ -0,0 +1,128 @@
+# utils/images.py
+
+import os
+import math
+from io import BytesIO
+from typing import Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+from utils.concurrency import run_blocking
+from utils.metrics import span
+
+# ─── CONFIG ────────────────────────────────────────────────────────────────────
+# Images above this many pixels are downscaled before they are sent to a model.
+IMAGE_MAX_PIXELS    = int(os.getenv("IMAGE_MAX_PIXELS", str(1024 * 1024)))
+# "auto" keeps PNG for images with transparency and uses JPEG otherwise.
+IMAGE_OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "auto").lower()
+IMAGE_QUALITY       = int(os.getenv("IMAGE_QUALITY", "85"))
+
+_FORMAT_MIME = {
+    "PNG":  "image/png",
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "GIF":  "image/gif",
+    "HEIF": "image/heif",
+}
+# Formats the models accept as-is
+_MODEL_MIME = {"image/png", "image/jpeg", "image/webp"}
+_METADATA_KEYS = ("exif", "xmp", "XML:com.adobe.xmp", "comment", "photoshop")
+
+
+def sniff_mime(data: bytes) -> str:
+    """
+    Guesses the MIME type from magic bytes. Defaults to image/png.
+    """
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "image/png"
+
+
+def _has_alpha(img: Image.Image) -> bool:
+    return img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+
+
+def _fit(width: int, height: int) -> Tuple[int, int]:
+    scale = math.sqrt(IMAGE_MAX_PIXELS / (width * height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def normalize_image(data: bytes) -> Tuple[bytes, str]:
+    """
+    Returns (bytes, mime_type) ready to upload to a model.
+    Images that are already small, in a supported format and free of metadata
+    are passed through untouched; everything else is EXIF-rotated, downscaled
+    to IMAGE_MAX_PIXELS and re-encoded without metadata.
+    Data Pillow can't read is passed through with a sniffed MIME type.
+    """
+    try:
+        img = Image.open(BytesIO(data))
+    except Exception:
+        return data, sniff_mime(data)
+
+    mime = _FORMAT_MIME.get(img.format, f"image/{(img.format or 'unknown').lower()}")
+    width, height = img.size
+    too_big = width * height > IMAGE_MAX_PIXELS
+    has_metadata = any(k in img.info for k in _METADATA_KEYS)
+    if not too_big and not has_metadata and mime in _MODEL_MIME:
+        return data, mime
+
+    if too_big:
+        # JPEG can decode at a reduced size directly, which is much cheaper
+        img.draft("RGB", _fit(width, height))
+    img = ImageOps.exif_transpose(img)
+    if img.width * img.height > IMAGE_MAX_PIXELS:
+        img = img.resize(_fit(img.width, img.height), Image.LANCZOS)
+
+    fmt = IMAGE_OUTPUT_FORMAT
+    if fmt == "auto":
+        fmt = "png" if _has_alpha(img) else "jpeg"
+
+    return _encode(img, fmt, IMAGE_QUALITY)
+
+
+def _encode(img: Image.Image, fmt: str, quality: int) -> Tuple[bytes, str]:
+    if img.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+        img = img.convert("RGBA" if _has_alpha(img) else "RGB")
+
+    buf = BytesIO()
+    if fmt == "jpeg":
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+        mime = "image/jpeg"
+    elif fmt == "webp":
+        img.save(buf, format="WEBP", quality=quality, method=4)
+        mime = "image/webp"
+    else:
+        img.save(buf, format="PNG")
+        mime = "image/png"
+    return buf.getvalue(), mime
+
+
+def encode_image(image: Union[bytes, Image.Image], fmt: Optional[str] = None,
+                 quality: int = IMAGE_QUALITY) -> Tuple[bytes, str]:
+    """
+    Returns (bytes, mime_type) of `image` (encoded bytes or a PIL image) as
+    `fmt` ("png", "jpeg" or "webp"; None keeps encoded bytes as they are and
+    writes PIL images as PNG). Bytes already in the target format are
+    returned as-is, without decoding.
+    """
+    if isinstance(image, Image.Image):
+        return _encode(image, fmt or "png", quality)
+    mime = sniff_mime(image)
+    if fmt is None or mime == f"image/{fmt}":
+        return image, mime
+    return _encode(Image.open(BytesIO(image)), fmt, quality)
+
+
+async def normalize_image_async(data: bytes) -> Tuple[bytes, str]:
+    """
+    Runs normalize_image on the worker pool.
+    """
+    with span("image_normalize"):
+        return await run_blocking(normalize_image, data)
@@ -0,0 +1,156 @@
+# utils/job_queue.py
+
+import time
+import uuid
+import asyncio
+import logging
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from utils.cache import TTLCache
+from utils.metrics import histogram, start_request
+from utils.retry import set_deadline
+
+logger = logging.getLogger(__name__)
+
+JOB_SECONDS = histogram("dearmind_job_seconds", "Job queue wait and run time", ("queue", "phase"))
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when the queue is at capacity."""
+
+
+class JobQueue:
+    """
+    Bounded in-process job queue served by `workers` asyncio tasks.
+    submit() returns a job id immediately, or raises QueueFull once
+    `max_queue` jobs are waiting. Queued and running jobs are kept until they
+    finish; finished jobs are then kept for `result_ttl` seconds.
+    An optional `on_done(job)` coroutine runs after each job (e.g. a callback).
+    Each job runs under its own `deadline` (seconds, see utils.retry).
+    """
+
+    def __init__(self, name: str, handler: Callable[..., Awaitable[Any]], workers: int = 4,
+                 max_queue: int = 100, result_ttl: float = 600.0,
+                 on_done: Optional[Callable[[SimpleNamespace], Awaitable[None]]] = None,
+                 deadline: Optional[float] = None):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.max_queue = max_queue
+        self.on_done = on_done
+        self.deadline = deadline
+        self._pending: Dict[str, SimpleNamespace] = {}
+        self._finished = TTLCache(maxsize=max(1000, max_queue * 10), ttl=result_ttl)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list = []
+        self._running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.succeeded = 0
+        self.failed = 0
+        self._wait_total = 0.0
+        self._run_total = 0.0
+
+    def _ensure_started(self) -> None:
+        # Workers are created lazily so the queue binds to the serving event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, *args, callback_url: Optional[str] = None, **kwargs) -> SimpleNamespace:
+        self._ensure_started()
+        job = SimpleNamespace(
+            id=uuid.uuid4().hex,
+            status="queued",
+            result=None,
+            error=None,
+            callback_url=callback_url,
+            submitted_at=time.time(),
+            started_at=None,
+            finished_at=None,
+            args=args,
+            kwargs=kwargs,
+        )
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFull(f"Job queue is full ({self.max_queue} waiting)")
+        self.submitted += 1
+        self._pending[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[SimpleNamespace]:
+        job = self._pending.get(job_id)
+        return job if job is not None else self._finished.get(job_id)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            # Each job gets its own timings; workers otherwise inherit the
+            # context of whichever request started them
+            timings = start_request()
+            set_deadline(self.deadline)
+            self._running += 1
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = await self.handler(*job.args, **job.kwargs)
+                job.status = "done"
+                self.succeeded += 1
+            except asyncio.CancelledError:
+                job.status, job.error = "failed", "cancelled"
+                self.failed += 1
+                raise
+            except Exception as e:
+                job.status, job.error = "failed", str(e)
+                self.failed += 1
+            finally:
+                job.finished_at = time.time()
+                job.args = job.kwargs = None  # drop the (possibly large) inputs
+                self._wait_total += job.started_at - job.submitted_at
+                self._run_total += job.finished_at - job.started_at
+                JOB_SECONDS.observe(job.started_at - job.submitted_at, queue=self.name, phase="wait")
+                JOB_SECONDS.observe(job.finished_at - job.started_at, queue=self.name, phase="run")
+                self._running -= 1
+                timings.finish(f"job:{self.name}")
+                # The result TTL starts once the job is finished
+                self._finished.set(job.id, job)
+                self._pending.pop(job.id, None)
+                self._queue.task_done()
+            if self.on_done is not None:
+                try:
+                    await self.on_done(job)
+                except Exception as e:
+                    logger.warning("Job %s callback failed: %s", job.id, e)
+
+    async def shutdown(self, timeout: Optional[float] = None) -> None:
+        """
+        Waits (up to `timeout` seconds) for queued jobs to finish, then stops the workers.
+        """
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Job queue shutdown timed out with %d jobs left", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._queue, self._tasks = None, []
+
+    def stats(self) -> dict:
+        finished = self.succeeded + self.failed
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": self._running,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "avg_wait_seconds": (self._wait_total / finished) if finished else 0.0,
+            "avg_run_seconds": (self._run_total / finished) if finished else 0.0,
+        }
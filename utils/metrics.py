@@ -0,0 +1,183 @@
+# utils/metrics.py
+
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# ─── METRIC TYPES ──────────────────────────────────────────────────────────────
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_metrics: Dict[str, "_Metric"] = {}
+_collectors: List[Tuple[str, Callable[[], dict]]] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(n, "") for n in self.labels), 0.0)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_fmt_labels(self.labels, k)} {v}" for k, v in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._values: Dict[tuple, list] = {}  # key → [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with _lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, row in sorted(self._values.items()):
+            for bound, count in zip(self.buckets, row):
+                le = _fmt_labels(self.labels, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{le} {count}")
+            le = _fmt_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {row[-1]}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {row[-2]}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {row[-1]}")
+        return lines
+
+
+def counter(name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+    with _lock:
+        if name not in _metrics:
+            _metrics[name] = Counter(name, help, labels)
+        return _metrics[name]
+
+
+def histogram(name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    with _lock:
+        if name not in _metrics:
+            _metrics[name] = Histogram(name, help, labels, buckets)
+        return _metrics[name]
+
+
+def register_stats(prefix: str, stats_fn: Callable[[], dict]) -> None:
+    """
+    Exposes every numeric value of `stats_fn()` as a gauge named dearmind_<prefix>_<key>.
+    """
+    _collectors.append((prefix, stats_fn))
+
+
+# ─── BUILT-IN METRICS ──────────────────────────────────────────────────────────
+REQUEST_SECONDS = histogram("dearmind_request_seconds", "HTTP request latency", ("route", "method", "status"))
+STAGE_SECONDS   = histogram("dearmind_stage_seconds", "Pipeline stage latency", ("route", "stage"))
+MODEL_SECONDS   = histogram("dearmind_model_call_seconds", "Model call latency", ("model", "outcome"))
+
+
+# ─── REQUEST SPANS ─────────────────────────────────────────────────────────────
+class RequestTimings:
+    """
+    Spans of one request. The route template is only known once routing is
+    done, so spans are buffered until finish() and recorded directly after that.
+    """
+
+    def __init__(self):
+        self.route: Optional[str] = None
+        self.spans: List[Tuple[str, float]] = []
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.spans.append((stage, seconds))
+        if self.route is not None:
+            STAGE_SECONDS.observe(seconds, route=self.route, stage=stage)
+
+    def finish(self, route: str) -> None:
+        self.route = route
+        for stage, seconds in list(self.spans):
+            STAGE_SECONDS.observe(seconds, route=route, stage=stage)
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.spans)
+
+
+_request: contextvars.ContextVar = contextvars.ContextVar("dearmind_request_timings", default=None)
+
+
+def start_request() -> RequestTimings:
+    timings = RequestTimings()
+    _request.set(timings)
+    return timings
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Times the enclosed block as pipeline stage `stage` of the current request
+    (route "background" outside of a request).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timings = _request.get()
+        if timings is None:
+            STAGE_SECONDS.observe(elapsed, route="background", stage=stage)
+        else:
+            timings.add(stage, elapsed)
+
+
+# ─── EXPOSITION ────────────────────────────────────────────────────────────────
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for metric in list(_metrics.values()):
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        with _lock:
+            lines.extend(metric.render())
+    for prefix, stats_fn in list(_collectors):
+        for key, value in stats_fn().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"dearmind_{prefix}_{key}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,180 @@
+# utils/models.py
+
+import time
+import logging
+import threading
+import functools
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from utils.concurrency import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# ─── CONFIG ────────────────────────────────────────────────────────────────────
+PROJECT_ID = "sc2025-test"
+REGION     = "us-central1"
+
+# ─── LAZY MODEL REGISTRY ───────────────────────────────────────────────────────
+# Services register a factory per model/client at import time (cheap), and the
+# object is only built on first use. This keeps vertexai.init, from_pretrained
+# and client construction out of the cold-start path.
+_factories: Dict[str, Callable[[], Any]] = {}
+_instances: Dict[str, Any] = {}
+_init_seconds: Dict[str, float] = {}
+_lock = threading.RLock()
+_vertexai_ready = False
+
+
+def init_vertexai() -> None:
+    """
+    Runs vertexai.init once per process.
+    """
+    global _vertexai_ready
+    if _vertexai_ready:
+        return
+    with _lock:
+        if _vertexai_ready:
+            return
+        start = time.perf_counter()
+        import vertexai
+        vertexai.init(project=PROJECT_ID, location=REGION)
+        _init_seconds["vertexai.init"] = time.perf_counter() - start
+        _vertexai_ready = True
+
+
+def register_model(key: str, factory: Callable[[], Any]) -> None:
+    """
+    Registers `factory` to build the model/client named `key` on first use.
+    Re-registering a key drops any instance built by the previous factory.
+    """
+    with _lock:
+        _factories[key] = factory
+        _instances.pop(key, None)
+
+
+def get_model(key: str) -> Any:
+    """
+    Returns the model/client for `key`, building it on first call.
+    """
+    inst = _instances.get(key)
+    if inst is not None:
+        return inst
+    with _lock:
+        inst = _instances.get(key)
+        if inst is None:
+            if key not in _factories:
+                raise KeyError(f"No model registered under {key!r}")
+            start = time.perf_counter()
+            inst = _factories[key]()
+            _init_seconds[key] = time.perf_counter() - start
+            _instances[key] = inst
+            logger.info("Initialized model %s in %.3fs", key, _init_seconds[key])
+    return inst
+
+
+async def get_model_async(key: str) -> Any:
+    """
+    Same as get_model, but a first-time build runs on the worker pool
+    so it never blocks the event loop.
+    """
+    inst = _instances.get(key)
+    if inst is not None:
+        return inst
+    return await run_blocking(get_model, key)
+
+
+def warm_up(keys: Optional[Iterable[str]] = None) -> Dict[str, str]:
+    """
+    Builds the given models (default: all registered ones).
+    Returns {key: error message} for the ones that failed.
+    """
+    errors: Dict[str, str] = {}
+    for key in list(keys if keys is not None else _factories):
+        try:
+            get_model(key)
+        except Exception as e:
+            logger.warning("Warm-up failed for %s: %s", key, e)
+            errors[key] = str(e)
+    return errors
+
+
+async def warm_up_async(keys: Optional[Iterable[str]] = None) -> Dict[str, str]:
+    return await run_blocking(warm_up, keys)
+
+
+# ─── VERTEX FACTORIES ──────────────────────────────────────────────────────────
+# The Vertex SDK takes seconds to import, so it is only imported in here.
+
+def vertex_generative_model(model_name: str) -> Callable[[], Any]:
+    def factory():
+        init_vertexai()
+        from vertexai.preview.generative_models import GenerativeModel
+        return GenerativeModel(model_name)
+    return factory
+
+
+def vertex_image_model(model_name: str) -> Callable[[], Any]:
+    def factory():
+        init_vertexai()
+        from vertexai.preview.vision_models import ImageGenerationModel
+        return ImageGenerationModel.from_pretrained(model_name)
+    return factory
+
+
+def vertex_embedding_model(model_name: str) -> Callable[[], Any]:
+    def factory():
+        init_vertexai()
+        from vertexai.language_models import TextEmbeddingModel
+        return TextEmbeddingModel.from_pretrained(model_name)
+    return factory
+
+
+def embed_texts(model, texts: List[str], task_type: str, batch_size: int = 16) -> List[List[float]]:
+    """
+    Embeds `texts` with a Vertex TextEmbeddingModel (blocking), in batches.
+    `task_type` is e.g. "RETRIEVAL_QUERY" or "RETRIEVAL_DOCUMENT".
+    """
+    from vertexai.language_models import TextEmbeddingInput
+    vectors: List[List[float]] = []
+    for i in range(0, len(texts), batch_size):
+        batch = [TextEmbeddingInput(text, task_type) for text in texts[i:i + batch_size]]
+        vectors.extend(e.values for e in model.get_embeddings(batch))
+    return vectors
+
+
+@functools.lru_cache(maxsize=None)
+def vertex_safety_settings() -> dict:
+    """
+    Safety settings shared by every Gemini call on Vertex.
+    """
+    import vertexai.preview.generative_models as generative_models
+    return {
+        generative_models.HarmCategory.HARM_CATEGORY_HATE_SPEECH:       generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+        generative_models.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+        generative_models.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+        generative_models.HarmCategory.HARM_CATEGORY_HARASSMENT:        generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+    }
+
+
+def preload_sdks() -> None:
+    """
+    Imports the Vertex and google-genai SDK modules without building any client.
+    A pre-forking server runs this once in the master process so workers
+    don't each pay the import; clients (gRPC channels, HTTP pools) must
+    only be created after the fork.
+    """
+    start = time.perf_counter()
+    import vertexai  # noqa: F401
+    import vertexai.language_models  # noqa: F401
+    import vertexai.preview.generative_models  # noqa: F401
+    import vertexai.preview.vision_models  # noqa: F401
+    import google.genai  # noqa: F401
+    vertex_safety_settings()
+    _init_seconds["sdk_imports"] = time.perf_counter() - start
+
+
+def init_report() -> Dict[str, float]:
+    """
+    Seconds spent building each model/client so far.
+    """
+    return dict(_init_seconds)
@@ -0,0 +1,123 @@
+# utils/prompt_budget.py
+
+import hashlib
+import logging
+from typing import Awaitable, Callable, List, Optional, Sequence
+
+from utils.cache import TTLCache
+from utils.metrics import counter, span
+
+logger = logging.getLogger(__name__)
+
+SUMMARIES = counter("dearmind_summaries_total", "Rolling summary folds", ("name", "result"))
+
+
+# ─── TOKEN COUNTING ────────────────────────────────────────────────────────────
+def count_tokens(text: str) -> int:
+    """
+    Cheap token estimate without a count_tokens round trip: about 4 UTF-8
+    bytes per token, which holds for English and slightly over-counts Korean
+    (3 bytes per syllable, roughly one token each), so budgets err on the safe side.
+    """
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+def newest_within(items: Sequence[str], budget: int, cost: Callable[[str], int] = count_tokens) -> int:
+    """
+    Returns the index of the first item of the longest suffix of `items`
+    (oldest first) whose total cost fits `budget`.
+    """
+    total = 0
+    start = len(items)
+    while start > 0:
+        total += cost(items[start - 1])
+        if total > budget:
+            break
+        start -= 1
+    return start
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    limit = budget * 4
+    data = text.encode("utf-8")
+    if len(data) <= limit:
+        return text
+    return data[:limit].decode("utf-8", errors="ignore").rstrip() + "…"
+
+
+# ─── ROLLING SUMMARIES ─────────────────────────────────────────────────────────
+SUMMARY_PROMPT = (
+    "Update the running summary below with the new items. Keep what matters for "
+    "an empathetic follow-up: the user's feelings and how they changed, important "
+    "events and people, and anything the user asked to be remembered. Write plain "
+    "prose in the language the items are written in, at most {words} words.\n\n"
+    "Running summary:\n{summary}\n\nNew items:\n{items}\n\nUpdated summary:"
+)
+
+
+class RollingSummarizer:
+    """
+    Folds items (chat turns, diary entries) that no longer fit a prompt into a
+    running summary, using `generate(prompt) -> text` (a cheap model call).
+    Folds are cached by content hash, so a summary is only recomputed when new
+    items actually arrive. If the model call fails, the items are appended to
+    the summary verbatim and truncated to the budget instead.
+    """
+
+    def __init__(self, name: str, generate: Callable[[str], Awaitable[str]], max_tokens: int = 256,
+                 cache_size: int = 1024, cache_ttl: float = 86400.0):
+        self.name = name
+        self.generate = generate
+        self.max_tokens = max_tokens
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    @staticmethod
+    def _key(summary: str, items: Sequence[str]) -> str:
+        h = hashlib.sha256(summary.encode("utf-8"))
+        for item in items:
+            h.update(b"\0" + item.encode("utf-8"))
+        return h.hexdigest()
+
+    async def fold(self, summary: str, items: Sequence[str]) -> str:
+        if not items:
+            return summary
+        key = self._key(summary, items)
+        cached = self._cache.get(key)
+        if cached is not None:
+            SUMMARIES.inc(name=self.name, result="cached")
+            return cached
+        prompt = SUMMARY_PROMPT.format(
+            words=self.max_tokens * 3 // 4,
+            summary=summary or "(none yet)",
+            items="\n".join(f"- {item}" for item in items),
+        )
+        try:
+            with span("summarize"):
+                folded = (await self.generate(prompt)).strip()
+            result = "ok"
+        except Exception as e:
+            logger.warning("%s summary failed, keeping items verbatim: %s", self.name, e)
+            folded, result = "", "error"
+        if not folded:
+            folded = "\n".join(filter(None, [summary, *items]))
+        folded = truncate_to_tokens(folded, self.max_tokens)
+        SUMMARIES.inc(name=self.name, result=result)
+        if result == "ok":
+            self._cache.set(key, folded)
+        return folded
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+async def fit_entries(entries: List[str], budget: int, summarizer: Optional[RollingSummarizer]) -> tuple[str, List[str]]:
+    """
+    Fits `entries` (oldest first) into `budget` tokens: the newest entries are
+    kept verbatim, older ones are folded into a summary (dropped without a
+    summarizer). Returns (summary, kept entries).
+    """
+    start = newest_within(entries, budget)
+    older, recent = entries[:start], entries[start:]
+    if not older or summarizer is None:
+        return "", recent
+    return await summarizer.fold("", older), recent
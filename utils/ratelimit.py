@@ -0,0 +1,128 @@
+# utils/ratelimit.py
+
+import os
+import re
+import time
+import asyncio
+from typing import Dict, Optional
+
+from utils.metrics import histogram
+
+# ─── CONFIG ────────────────────────────────────────────────────────────────────
+# Client-side request pacing per model, in requests per minute (the unit Vertex
+# quotas use). 0 disables pacing. Override per model with AI_MODEL_RPM_<MODEL>,
+# e.g. AI_MODEL_RPM_IMAGEGENERATION_006=30. AI_MODEL_BURST(_<MODEL>) is the
+# bucket size, i.e. how many calls may start back to back after an idle period.
+DEFAULT_MODEL_RPM = float(os.getenv("AI_MODEL_RPM", "0"))
+DEFAULT_MODEL_BURST = float(os.getenv("AI_MODEL_BURST", "5"))
+
+THROTTLE_SECONDS = histogram(
+    "dearmind_model_throttle_seconds", "Time spent waiting for the per-model rate limiter", ("model",)
+)
+
+
+def model_setting(prefix: str, model_name: str, default: float) -> float:
+    """
+    Returns <prefix>_<MODEL> from the environment, falling back to `default`.
+    """
+    env_key = prefix + "_" + re.sub(r"[^A-Z0-9]", "_", model_name.upper())
+    return float(os.getenv(env_key, default))
+
+
+class RateLimited(Exception):
+    """Raised when a rate-limiter wait would run past the caller's deadline."""
+
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` tokens per second, at most `burst` stored.
+    A rate of 0 never waits for tokens, but pause() still applies, so a model
+    that starts answering 429 cools down for every caller at once.
+    Not thread-safe; use it from the event loop only.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self) -> float:
+        """
+        Takes one token (possibly going negative, i.e. queueing behind earlier
+        callers) and returns how long the caller has to wait for it.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self._paused_until - now)
+        if self.rate > 0:
+            self._tokens -= 1
+            if self._tokens < 0:
+                wait = max(wait, -self._tokens / self.rate)
+        return wait
+
+    async def acquire(self, timeout: Optional[float] = None) -> float:
+        """
+        Waits for a token and returns the time waited. Raises RateLimited
+        (without taking a token) if that would take longer than `timeout`.
+        """
+        wait = self._reserve()
+        if timeout is not None and wait > timeout:
+            if self.rate > 0:
+                self._tokens += 1  # give the reservation back
+            raise RateLimited(f"Rate limiter wait of {wait:.1f}s exceeds the remaining {timeout:.1f}s")
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """
+        Holds back every caller for `seconds` (used after a quota error).
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        if self.rate > 0:
+            self._tokens = min(self._tokens, 0.0)
+
+    def stats(self) -> dict:
+        self._refill(time.monotonic())
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "tokens": self._tokens,
+            "paused_seconds": max(0.0, self._paused_until - time.monotonic()),
+        }
+
+
+_buckets: Dict[str, TokenBucket] = {}
+
+
+def model_bucket(model_name: str) -> TokenBucket:
+    bucket = _buckets.get(model_name)
+    if bucket is None:
+        rpm = model_setting("AI_MODEL_RPM", model_name, DEFAULT_MODEL_RPM)
+        burst = model_setting("AI_MODEL_BURST", model_name, DEFAULT_MODEL_BURST)
+        bucket = _buckets[model_name] = TokenBucket(rpm / 60.0, burst)
+    return bucket
+
+
+async def throttle(model_name: str, timeout: Optional[float] = None) -> None:
+    """
+    Paces calls to `model_name` to its configured rate.
+    """
+    waited = await model_bucket(model_name).acquire(timeout)
+    THROTTLE_SECONDS.observe(waited, model=model_name)
+
+
+def limiter_stats() -> dict:
+    stats = {}
+    for name, bucket in list(_buckets.items()):
+        prefix = re.sub(r"[^a-z0-9]", "_", name.lower())
+        for key, value in bucket.stats().items():
+            stats[f"{prefix}_{key}"] = value
+    return stats
@@ -0,0 +1,136 @@
+# utils/result_cache.py
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Optional
+
+from utils.cache import TTLCache
+from utils.concurrency import run_blocking
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """
+    Two-tier cache for JSON-serializable results keyed by a content hash.
+    Tier 1 is an in-memory LRU+TTL cache; tier 2 is an optional SQLite file
+    (`db_path`) that survives restarts, trimmed by TTL and to `max_rows`.
+    Disk access runs on the worker pool.
+    The database is opened on first use in each process, never inherited
+    across fork() (a pre-forking server builds this in its master).
+    """
+
+    _TRIM_EVERY = 100  # writes between disk trims
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 86400.0,
+                 db_path: Optional[str] = None, max_rows: int = 100000):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.db_path = db_path
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_pid: Optional[int] = None
+        self._db_lock = threading.Lock()
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Call with _db_lock held
+        if self._db is None or self._db_pid != os.getpid():
+            # A connection inherited from a parent process is left alone, not closed
+            db = sqlite3.connect(self.db_path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            db.commit()
+            self._db, self._db_pid = db, os.getpid()
+        return self._db
+
+    async def aget(self, key: str) -> Optional[dict]:
+        value = self._memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        if not self.db_path:
+            self.misses += 1
+            return None
+        value = await run_blocking(self._disk_get, key)
+        if value is not None:
+            self.disk_hits += 1
+            self._memory.set(key, value)
+            return value
+        self.misses += 1
+        return None
+
+    async def aset(self, key: str, value: dict) -> None:
+        self._memory.set(key, value)
+        if self.db_path:
+            await run_blocking(self._disk_set, key, value)
+
+    # ── disk tier ─────────────────────────────────────────────────────────────
+    def _disk_get(self, key: str) -> Optional[dict]:
+        if not self.db_path:
+            return None
+        now = time.time()
+        try:
+            with self._db_lock:
+                db = self._connection()
+                row = db.execute(
+                    "SELECT value FROM results WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is None:
+                    return None
+                db.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+                db.commit()
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            logger.warning("Result cache read failed: %s", e)
+            return None
+
+    def _disk_set(self, key: str, value: dict) -> None:
+        if not self.db_path:
+            return
+        now = time.time()
+        try:
+            with self._db_lock:
+                db = self._connection()
+                db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now + self.ttl, now),
+                )
+                self._writes += 1
+                if self._writes % self._TRIM_EVERY == 0:
+                    self._trim(db, now)
+                db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Result cache write failed: %s", e)
+
+    def _trim(self, db: sqlite3.Connection, now: float) -> None:
+        db.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+        db.execute(
+            "DELETE FROM results WHERE key IN ("
+            " SELECT key FROM results ORDER BY accessed_at ASC"
+            " LIMIT max(0, (SELECT COUNT(*) FROM results) - ?))",
+            (self.max_rows,),
+        )
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "memory_size": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (hits / total) if total else 0.0,
+            "disk_enabled": bool(self.db_path),
+        }
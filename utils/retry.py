@@ -0,0 +1,106 @@
+# utils/retry.py
+
+import os
+import time
+import random
+import asyncio
+import contextvars
+from typing import Optional
+
+from utils.ratelimit import RateLimited
+
+# ─── CONFIG ────────────────────────────────────────────────────────────────────
+# Attempts per model call (1 = no retries) and the exponential backoff between
+# them: a random delay in [0, min(cap, base * 2^n)] ("full jitter").
+MODEL_RETRY_ATTEMPTS = int(os.getenv("AI_RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("AI_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("AI_RETRY_MAX_DELAY", "8"))
+
+# HTTP statuses worth retrying: quota, transient server errors, timeouts
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+# gRPC-style names used by google.api_core for the same conditions
+RETRYABLE_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "BadGateway", "GatewayTimeout", "DeadlineExceeded", "Aborted",
+}
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request's deadline passes before its model calls are done."""
+
+
+# ─── DEADLINES ─────────────────────────────────────────────────────────────────
+_deadline: contextvars.ContextVar = contextvars.ContextVar("dearmind_deadline", default=None)
+
+
+def set_deadline(seconds: Optional[float]) -> None:
+    """
+    Gives the current request (context) `seconds` from now to finish.
+    None or a non-positive value means no deadline.
+    """
+    _deadline.set(time.monotonic() + seconds if seconds and seconds > 0 else None)
+
+
+def remaining() -> Optional[float]:
+    """
+    Seconds left until the current deadline, or None without one.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check_deadline() -> Optional[float]:
+    """
+    Returns remaining(), raising DeadlineExceeded if it has already passed.
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return left
+
+
+# ─── ERROR CLASSIFICATION ──────────────────────────────────────────────────────
+def error_code(exc: BaseException) -> Optional[int]:
+    # google.api_core errors carry an HTTPStatus, google.genai errors an int
+    code = getattr(exc, "code", None)
+    try:
+        return int(code) if code is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_quota_error(exc: BaseException) -> bool:
+    return error_code(exc) == 429 or type(exc).__name__ in ("ResourceExhausted", "TooManyRequests")
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    True for errors a retry can fix (quota, overload, transient server errors).
+    Bad requests, safety blocks and auth errors are not retried.
+    """
+    if isinstance(exc, (DeadlineExceeded, asyncio.CancelledError)):
+        return False
+    if isinstance(exc, (ConnectionError, asyncio.TimeoutError)):
+        return True
+    return error_code(exc) in RETRYABLE_CODES or type(exc).__name__ in RETRYABLE_NAMES
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY) -> float:
+    """
+    Full-jitter exponential backoff before retry number `attempt` (1-based).
+    """
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+def error_status(exc: BaseException) -> int:
+    """
+    HTTP status for a failed service call: 504 past the deadline, 503 when the
+    model is overloaded or out of quota (worth retrying later), else 500.
+    """
+    if isinstance(exc, DeadlineExceeded):
+        return 504
+    if isinstance(exc, RateLimited) or is_quota_error(exc) or error_code(exc) == 503:
+        return 503
+    return 500
@@ -0,0 +1,85 @@
+# utils/session_store.py
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class SessionStore:
+    """
+    In-process LRU store for per-user session objects.
+    Entries are evicted when idle for longer than `idle_ttl` seconds, when there
+    are more than `max_sessions` of them, or when their summed `size`
+    (caller-supplied, roughly bytes) exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_sessions: int = 1000, max_bytes: int = 64 * 1024 * 1024, idle_ttl: float = 1800.0):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, list]" = OrderedDict()  # key → [last_used, size, value]
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry[0] = now
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: Hashable, value: Any, size: int = 0) -> None:
+        """
+        Inserts or refreshes `key`. Call again after a session grows to update its size.
+        """
+        now = time.monotonic()
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = [now, size, value]
+            self._bytes += size
+            self._evict_idle(now)
+            while self._data and (len(self._data) > self.max_sessions or self._bytes > self.max_bytes):
+                self._pop_oldest()
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def _evict_idle(self, now: float) -> None:
+        # Oldest entries come first, so stop at the first one still in use
+        while self._data:
+            entry = next(iter(self._data.values()))
+            if now - entry[0] <= self.idle_ttl:
+                break
+            self._pop_oldest()
+
+    def _pop_oldest(self) -> None:
+        _, entry = self._data.popitem(last=False)
+        self._bytes -= entry[1]
+        self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,61 @@
+# utils/singleflight.py
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one upstream call.
+    The first caller starts `fn` as a task; callers arriving while it runs
+    wait on the same task and all receive its result or exception.
+    A caller that is cancelled only stops waiting; the shared call is
+    cancelled once no caller is waiting for it any more.
+    Nothing is kept after the call finishes (that is the result caches' job).
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.abandoned = 0
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda t, key=key: self._forget(key, t))
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+        self._waiters[key] += 1
+        try:
+            # shield: one caller's cancellation must not cancel the shared call
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self._calls.get(key) is task and self._waiters[key] == 1:
+                self.abandoned += 1
+                task.cancel()
+            raise
+        finally:
+            if self._calls.get(key) is task:
+                self._waiters[key] -= 1
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
+        if not task.cancelled():
+            task.exception()  # mark as retrieved even if every waiter left
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "abandoned": self.abandoned,
+        }
@@ -0,0 +1,60 @@
+# utils/startup.py
+
+import os
+import time
+import logging
+import importlib
+from typing import Any, Dict
+
+from utils.models import init_report, warm_up_async
+
+logger = logging.getLogger(__name__)
+
+# ─── CONFIG ────────────────────────────────────────────────────────────────────
+# AI_WARMUP=1 builds models in the background right after startup;
+# AI_WARMUP_MODELS limits it to a comma-separated subset of registry keys.
+WARMUP_ENABLED = os.getenv("AI_WARMUP", "0") == "1"
+WARMUP_MODELS  = [m.strip() for m in os.getenv("AI_WARMUP_MODELS", "").split(",") if m.strip()]
+
+_started_at = time.perf_counter()
+_import_seconds: Dict[str, float] = {}
+_warmup: Dict[str, Any] = {
+    "status": "pending" if WARMUP_ENABLED else "disabled",
+    "seconds": None,
+    "errors": {},
+}
+
+
+def timed_import(module_name: str):
+    """
+    Imports `module_name` and records how long it took. Shared dependencies are
+    charged to whichever module imports them first.
+    """
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    _import_seconds[module_name] = time.perf_counter() - start
+    return module
+
+
+async def run_warmup() -> None:
+    """
+    Builds the registered models off the event loop and records the outcome.
+    """
+    _warmup["status"] = "running"
+    start = time.perf_counter()
+    errors = await warm_up_async(WARMUP_MODELS or None)
+    _warmup.update(status="done", seconds=time.perf_counter() - start, errors=errors)
+    logger.info("Model warm-up finished in %.3fs (errors: %s)", _warmup["seconds"], errors or "none")
+
+
+def is_ready() -> bool:
+    return _warmup["status"] in ("disabled", "done")
+
+
+def startup_report() -> Dict[str, Any]:
+    return {
+        "imports": dict(_import_seconds),
+        "models": init_report(),
+        "warmup": dict(_warmup),
+        "uptime": time.perf_counter() - _started_at,
+    }
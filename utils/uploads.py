@@ -0,0 +1,52 @@
+# utils/uploads.py
+
+import os
+from tempfile import SpooledTemporaryFile
+
+from fastapi import HTTPException, Request, UploadFile
+
+# Largest single image accepted by the binary upload endpoints
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+# Uploads larger than this spill from memory to a temp file while streaming in
+SPOOL_MAX_MEMORY = 1024 * 1024
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Image exceeds {MAX_UPLOAD_BYTES} bytes")
+
+
+async def read_upload(file: UploadFile) -> bytes:
+    """
+    Returns the content of a multipart file (already spooled by Starlette).
+    """
+    size = getattr(file, "size", None)
+    if size is not None and size > MAX_UPLOAD_BYTES:
+        raise _too_large()
+    data = await file.read()
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise _too_large()
+    return data
+
+
+async def read_raw_body(request: Request) -> bytes:
+    """
+    Streams a raw image request body into a spooled buffer and returns its bytes.
+    The Content-Type must be image/*, so a stray JSON or form body is rejected
+    (415) instead of being sent on as an image.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if not content_type.startswith("image/"):
+        raise HTTPException(
+            status_code=415, detail=f"Content-Type must be image/*, got {content_type or 'none'}"
+        )
+    with SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) as spool:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise _too_large()
+            spool.write(chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Empty request body")
+        spool.seek(0)
+        return spool.read()
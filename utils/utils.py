@@ -1,37 +1,72 @@
+import os
+import asyncio
+import logging
 import requests
 import datetime
-from typing import List, Mapping, Optional
+from typing import List, Mapping, Optional, Tuple
+from requests.adapters import HTTPAdapter
+
+from utils.cache import TTLCache
+from utils.concurrency import run_blocking
+from utils.metrics import register_stats, span
+
+logger = logging.getLogger(__name__)
 
 HISTORY_URL = "https://dearmind-be.onrender.com/chat/history"
 DIARY_URL   = "https://dearmind-be.onrender.com/diary/by-date"
 
+# ─── POOLED HTTP CLIENT ────────────────────────────────────────────────────────
+# One keep-alive session for every backend call, so chat turns reuse warm
+# TLS connections instead of handshaking on each request.
+BACKEND_POOL_SIZE = int(os.getenv("BACKEND_POOL_SIZE", "32"))
+BACKEND_TIMEOUT   = float(os.getenv("BACKEND_TIMEOUT", "5"))
+
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=BACKEND_POOL_SIZE)
+session.mount("https://", _adapter)
+session.mount("http://", _adapter)
+
+# Today's diary rarely changes between chat turns → short-lived cache per (token, date)
+DIARY_CACHE_TTL = float(os.getenv("DIARY_CACHE_TTL", "30"))
+_diary_cache = TTLCache(maxsize=int(os.getenv("DIARY_CACHE_SIZE", "1024")), ttl=DIARY_CACHE_TTL)
+register_stats("diary_cache", _diary_cache.stats)
+
 def fetch_chat_history(token: str) -> List[Mapping[str, str]]:
     """
     Returns a list of dicts like {"role":"user"|"assistant","content": "..."}
     """
     headers = {"Authorization": f"Bearer {token}"}
-    print(f"[fetch_chat_history] GET {HISTORY_URL} with headers={headers}")
-    resp = requests.get(HISTORY_URL, headers=headers, timeout=5)
-    resp.raise_for_status()
-    return resp.json()
+    logger.debug("[fetch_chat_history] GET %s", HISTORY_URL)
+    with span("history_fetch"):
+        resp = session.get(HISTORY_URL, headers=headers, timeout=BACKEND_TIMEOUT)
+        resp.raise_for_status()
+        return resp.json()
 
-def fetch_diary_by_date(token: str, date: Optional[str] = None) -> List[str]:
+def fetch_diary_by_date(token: str, date: Optional[str] = None, use_cache: bool = True) -> List[str]:
     """
     Returns the diary entries for the given date (ISO YYYY-MM-DD).
     If no `date` is provided, uses today’s date.
+    Results are cached for DIARY_CACHE_TTL seconds per (token, date).
     """
     date = date or datetime.date.today().isoformat()
+    if use_cache:
+        cached = _diary_cache.get((token, date))
+        if cached is not None:
+            return list(cached)
+
     url = f"{DIARY_URL}?date={date}"
     headers = {"Authorization": f"Bearer {token}"}
 
-    print(f"[fetch_diary_by_date] GET {url} with headers={headers}")
+    logger.debug("[fetch_diary_by_date] GET %s", url)
     try:
-        resp = requests.get(url, headers=headers, timeout=5)
-        resp.raise_for_status()
+        with span("diary_fetch"):
+            resp = session.get(url, headers=headers, timeout=BACKEND_TIMEOUT)
+            resp.raise_for_status()
     except requests.exceptions.HTTPError as e:
         # 404: NotFoundException 에 대응하여 빈 리스트로
         if resp.status_code == 404:
-            print(f"[fetch_diary_by_date] 404 received → returning []")
+            logger.debug("[fetch_diary_by_date] 404 received → returning []")
+            _diary_cache.set((token, date), [])
             return []
         # 그 외 에러는 그대로 올리기
         raise
@@ -69,4 +104,17 @@ def fetch_diary_by_date(token: str, date: Optional[str] = None) -> List[str]:
             if isinstance(v, str):
                 texts.append(v)
 
-    return texts
+    _diary_cache.set((token, date), texts)
+    return list(texts)
+
+
+async def fetch_chat_context(token: str, date: Optional[str] = None) -> Tuple[List[Mapping[str, str]], List[str]]:
+    """
+    Fetches chat history and the diary entries for `date` concurrently.
+    Returns (history, diaries).
+    """
+    history, diaries = await asyncio.gather(
+        run_blocking(fetch_chat_history, token=token),
+        run_blocking(fetch_diary_by_date, token=token, date=date),
+    )
+    return history, diaries
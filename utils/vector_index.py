@@ -0,0 +1,134 @@
+# utils/vector_index.py
+
+import os
+import json
+import shutil
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Snapshot layout (one directory):
+#   meta.json       embedding model, dimension, distance, source corpus, build info
+#   embeddings.npy  float32 [n_chunks, dim], L2-normalized
+#   texts.bin       UTF-8 chunk texts, concatenated
+#   offsets.npy     int64 [n_chunks + 1] byte offsets into texts.bin
+#   queries.npy     float32 [n_queries, dim] precomputed query embeddings (optional)
+#   queries.json    the query texts of queries.npy, same order (optional)
+# The arrays are opened memory-mapped, so worker processes share the pages.
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class VectorIndex:
+    """
+    Read-only, memory-mapped embedding index with exact cosine top-k search.
+    Distances follow Vertex RAG's COSINE metric (1 - cosine similarity):
+    search() returns at most `top_k` chunks whose distance is below `max_distance`.
+    """
+
+    def __init__(self, path: str, meta: dict, embeddings: np.ndarray, texts: np.ndarray,
+                 offsets: np.ndarray, queries: Dict[str, int], query_vectors: Optional[np.ndarray]):
+        self.path = path
+        self.meta = meta
+        self.embeddings = embeddings
+        self._texts = texts
+        self._offsets = offsets
+        self._queries = queries
+        self._query_vectors = query_vectors
+
+    @classmethod
+    def load(cls, path: str) -> "VectorIndex":
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        texts_path = os.path.join(path, "texts.bin")
+        if os.path.getsize(texts_path):
+            texts = np.memmap(texts_path, dtype=np.uint8, mode="r")
+        else:
+            texts = np.zeros(0, dtype=np.uint8)  # mmap can't map an empty file
+        queries, query_vectors = {}, None
+        if os.path.exists(os.path.join(path, "queries.npy")):
+            query_vectors = np.load(os.path.join(path, "queries.npy"), mmap_mode="r")
+            with open(os.path.join(path, "queries.json"), encoding="utf-8") as f:
+                queries = {text: i for i, text in enumerate(json.load(f))}
+        if embeddings.shape[0] + 1 != offsets.shape[0]:
+            raise ValueError(f"Corrupt index at {path}: {embeddings.shape[0]} vectors, {offsets.shape[0]} offsets")
+        logger.info("Loaded vector index %s: %d chunks, dim %d", path, embeddings.shape[0], embeddings.shape[1])
+        return cls(path, meta, embeddings, texts, offsets, queries, query_vectors)
+
+    def __len__(self) -> int:
+        return self.embeddings.shape[0]
+
+    @property
+    def embedding_model(self) -> str:
+        return self.meta["embedding_model"]
+
+    def text(self, i: int) -> str:
+        return bytes(self._texts[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8")
+
+    def query_vector(self, query: str) -> Optional[np.ndarray]:
+        """
+        The precomputed embedding of `query`, if the snapshot has one.
+        """
+        i = self._queries.get(query)
+        return None if i is None else np.asarray(self._query_vectors[i])
+
+    def search(self, query_vector: Sequence[float], top_k: int, max_distance: float) -> List[Tuple[int, float]]:
+        """
+        Returns [(chunk index, distance)] of the nearest chunks, nearest first.
+        """
+        if len(self) == 0 or top_k <= 0:
+            return []
+        q = _normalize(query_vector)
+        distances = 1.0 - self.embeddings @ q
+        candidates = np.flatnonzero(distances < max_distance)
+        if candidates.size > top_k:
+            part = np.argpartition(distances[candidates], top_k - 1)[:top_k]
+            candidates = candidates[part]
+        order = candidates[np.argsort(distances[candidates], kind="stable")]
+        return [(int(i), float(distances[i])) for i in order]
+
+    def search_texts(self, query_vector: Sequence[float], top_k: int, max_distance: float) -> List[str]:
+        return [self.text(i) for i, _ in self.search(query_vector, top_k, max_distance)]
+
+    # ── building ──────────────────────────────────────────────────────────────
+    @staticmethod
+    def write(path: str, meta: dict, texts: List[str], embeddings: np.ndarray,
+              queries: Optional[Dict[str, Sequence[float]]] = None) -> None:
+        """
+        Writes a snapshot to `path`, replacing any existing one only once the
+        new snapshot is complete (readers mapping the old files keep working).
+        """
+        embeddings = _normalize(embeddings).reshape(len(texts), -1)
+        tmp = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        encoded = [t.encode("utf-8") for t in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        with open(os.path.join(tmp, "texts.bin"), "wb") as f:
+            f.write(b"".join(encoded))
+        np.save(os.path.join(tmp, "offsets.npy"), offsets)
+        np.save(os.path.join(tmp, "embeddings.npy"), embeddings)
+        if queries:
+            np.save(os.path.join(tmp, "queries.npy"), _normalize(list(queries.values())))
+            with open(os.path.join(tmp, "queries.json"), "w", encoding="utf-8") as f:
+                json.dump(list(queries), f, ensure_ascii=False)
+        meta = dict(meta, chunks=len(texts), dim=int(embeddings.shape[1]) if len(texts) else 0, distance="COSINE")
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        old = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, old)
+        os.rename(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)